@@ -1,3 +1,4 @@
+import json
 import math
 import os
 import time
@@ -5,6 +6,7 @@ import difflib
 from typing import Optional, Tuple, List
 
 import httpx
+import numpy as np
 
 # Hardcoded coordinates for Kazakhstan cities (lat, lon)
 # Used as primary lookup before falling back to 2GIS Geocoder API.
@@ -125,14 +127,52 @@ OFFICE_COORDS: dict[str, Tuple[float, float]] = {
 }
 
 
+_EARTH_RADIUS_KM = 6371.0
+
+
 def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Calculate great-circle distance in km between two coordinates."""
-    R = 6371.0
     phi1, phi2 = math.radians(lat1), math.radians(lat2)
     dphi = math.radians(lat2 - lat1)
     dlambda = math.radians(lon2 - lon1)
     a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    # asin form: one trig call and one sqrt fewer than atan2(sqrt(a), sqrt(1-a)),
+    # numerically identical for a in [0, 1] and matching the vectorized
+    # office-distance functions below.
+    return _EARTH_RADIUS_KM * 2 * math.asin(math.sqrt(a))
+
+
+# Office coordinates pre-converted to radian arrays (one float64 column per
+# component) so office-distance ranking runs as one vectorized haversine
+# instead of a Python loop over OFFICE_COORDS.
+_OFFICE_NAMES: List[str] = list(OFFICE_COORDS)
+_OFFICE_LAT_RAD = np.radians(np.array([OFFICE_COORDS[n][0] for n in _OFFICE_NAMES]))
+_OFFICE_LON_RAD = np.radians(np.array([OFFICE_COORDS[n][1] for n in _OFFICE_NAMES]))
+_OFFICE_COS_LAT = np.cos(_OFFICE_LAT_RAD)
+
+
+def _office_distances(client_lat: float, client_lon: float) -> np.ndarray:
+    """Distances (km) from one client point to every office, vectorized."""
+    lat_r = math.radians(client_lat)
+    lon_r = math.radians(client_lon)
+    dlat = _OFFICE_LAT_RAD - lat_r
+    dlon = _OFFICE_LON_RAD - lon_r
+    a = np.sin(dlat * 0.5) ** 2 + math.cos(lat_r) * _OFFICE_COS_LAT * np.sin(dlon * 0.5) ** 2
+    return 2.0 * _EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def office_distances_batch(lats, lons) -> np.ndarray:
+    """
+    Distance matrix (km) for many clients at once: rows follow the input
+    order, columns follow OFFICE_COORDS insertion order. One broadcasted
+    (B, 1) x (1, N) haversine expression for the whole batch.
+    """
+    lat_r = np.radians(np.asarray(lats, dtype=float))[:, None]
+    lon_r = np.radians(np.asarray(lons, dtype=float))[:, None]
+    dlat = _OFFICE_LAT_RAD[None, :] - lat_r
+    dlon = _OFFICE_LON_RAD[None, :] - lon_r
+    a = np.sin(dlat * 0.5) ** 2 + np.cos(lat_r) * _OFFICE_COS_LAT[None, :] * np.sin(dlon * 0.5) ** 2
+    return 2.0 * _EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
 
 
 # ---------------------------------------------------------------------------
@@ -208,6 +248,23 @@ def _latin_to_cyrillic(name: str) -> str:
     return _LATIN_TO_CYRILLIC.get(name.strip().lower(), name)
 
 
+# ---------------------------------------------------------------------------
+# One-probe exact city → office table: normalised office-city names and their
+# Latin aliases resolve to the canonical office in a single dict get. At ~50
+# fixed keys a hash lookup already costs O(len(key)) — flatter than a trie
+# descent — so fuzzy_office_city only pays for alias translation and difflib
+# on a genuine miss. Ambiguous cities (several offices) are stored as None so
+# they short-circuit without falling through to fuzzy matching.
+# ---------------------------------------------------------------------------
+_CITY_OFFICE_EXACT: dict[str, Optional[str]] = {}
+for _city_key, _office_list in CITY_TO_OFFICES.items():
+    _CITY_OFFICE_EXACT[_city_key] = _office_list[0] if len(_office_list) == 1 else None
+for _alias, _canon in _LATIN_TO_CYRILLIC.items():
+    _canon_key = _canon.strip().lower()
+    if _canon_key in CITY_TO_OFFICES and _alias not in _CITY_OFFICE_EXACT:
+        _CITY_OFFICE_EXACT[_alias] = _CITY_OFFICE_EXACT[_canon_key]
+
+
 # ---------------------------------------------------------------------------
 # Fuzzy matching
 # ---------------------------------------------------------------------------
@@ -232,12 +289,12 @@ def fuzzy_office_city(city_name: str) -> Optional[str]:
     """
     if not city_name:
         return None
-    city_name = _latin_to_cyrillic(city_name)
+    # Exact match first: one probe covers office cities and Latin aliases
+    # alike (None marks an ambiguous multi-office city).
     norm = city_name.strip().lower()
-    # Exact match first
-    if norm in CITY_TO_OFFICES:
-        offices = CITY_TO_OFFICES[norm]
-        return offices[0] if len(offices) == 1 else None  # ambiguous → None
+    if norm in _CITY_OFFICE_EXACT:
+        return _CITY_OFFICE_EXACT[norm]
+    city_name = _latin_to_cyrillic(city_name)
     # Fuzzy match against office city names
     matches = difflib.get_close_matches(city_name, OFFICE_COORDS.keys(), n=1, cutoff=0.75)
     if matches:
@@ -328,6 +385,40 @@ def _twogis_geocode(
     return None
 
 
+# ---------------------------------------------------------------------------
+# Persistent geocode cache: (city, region, country) → (lat, lon), stored as
+# JSON next to the input CSVs so repeated addresses skip the 2GIS round-trip
+# across pipeline runs and server restarts. The in-memory dict doubles as the
+# per-run L1; only successful lookups are written to disk, so transient
+# failures (missing key, timeout) get retried on the next run.
+# ---------------------------------------------------------------------------
+GEO_CACHE_PATH = os.getenv(
+    "GEO_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "geocode_cache.json"),
+)
+
+_geo_cache: dict[str, Optional[list]] = {}
+try:
+    with open(GEO_CACHE_PATH, encoding="utf-8") as _f:
+        _geo_cache = json.load(_f)
+    print(f"[Geocoding] Loaded {len(_geo_cache)} cached locations from {GEO_CACHE_PATH}")
+except FileNotFoundError:
+    pass
+except Exception as _e:
+    print(f"[Geocoding] Could not load geocode cache: {_e}")
+
+
+def _save_geo_cache() -> None:
+    try:
+        with open(GEO_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump(
+                {k: v for k, v in _geo_cache.items() if v is not None},
+                f, ensure_ascii=False,
+            )
+    except Exception as e:
+        print(f"[Geocoding] Could not save geocode cache: {e}")
+
+
 # ---------------------------------------------------------------------------
 # Public geocoding entry point
 # ---------------------------------------------------------------------------
@@ -338,6 +429,30 @@ def geocode_client(
     country: Optional[str],
     street: Optional[str] = None,
     house: Optional[str] = None,
+) -> Optional[Tuple[float, float]]:
+    """
+    Cached wrapper over _geocode_client_uncached. Keyed on the normalised
+    (city, region, country) triple — the only fields the lookup actually
+    uses — with the on-disk JSON cache as L2 behind the in-memory dict.
+    """
+    key = "|".join((part or "").strip().lower() for part in (city, region, country))
+    if key in _geo_cache:
+        hit = _geo_cache[key]
+        return (hit[0], hit[1]) if hit else None
+
+    coords = _geocode_client_uncached(city, region, country, street=street, house=house)
+    _geo_cache[key] = list(coords) if coords else None
+    if coords:
+        _save_geo_cache()
+    return coords
+
+
+def _geocode_client_uncached(
+    city: Optional[str],
+    region: Optional[str],
+    country: Optional[str],
+    street: Optional[str] = None,
+    house: Optional[str] = None,
 ) -> Optional[Tuple[float, float]]:
     """
     Resolve a client location to (lat, lon) using city + region only.
@@ -400,19 +515,14 @@ def geocode_client(
 
 def find_nearest_office(client_lat: float, client_lon: float) -> str:
     """Return the name of the nearest office to the given coordinates."""
-    nearest = min(
-        OFFICE_COORDS.items(),
-        key=lambda kv: haversine(client_lat, client_lon, kv[1][0], kv[1][1]),
-    )
-    return nearest[0]
+    return _OFFICE_NAMES[int(np.argmin(_office_distances(client_lat, client_lon)))]
 
 
 def find_sorted_offices(client_lat: float, client_lon: float) -> list:
     """Return all offices sorted by distance ascending: list of (distance_km, office_name)."""
-    return sorted(
-        (haversine(client_lat, client_lon, lat, lon), name)
-        for name, (lat, lon) in OFFICE_COORDS.items()
-    )
+    distances = _office_distances(client_lat, client_lon)
+    order = np.argsort(distances, kind="stable")
+    return [(float(distances[i]), _OFFICE_NAMES[i]) for i in order]
 
 
 def is_foreign(country: Optional[str]) -> bool:
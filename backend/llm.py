@@ -3,6 +3,9 @@ import os
 import json
 import base64
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import msgspec
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -54,9 +57,14 @@ TICKET_TYPES = [
     "Спам",
 ]
 
+# Precomputed validation sets — analyze_ticket runs once per ticket, so don't
+# rebuild these on every call.
+VALID_TICKET_TYPES = frozenset(TICKET_TYPES)
+VALID_SENTIMENTS = frozenset({"Позитивный", "Нейтральный", "Негативный"})
+
 # Keywords that suggest a user is referencing an attachment in their description.
 # If these appear but the attachment field is empty, it's an edge case.
-ATTACHMENT_REF_KEYWORDS = [
+ATTACHMENT_REF_KEYWORDS = (
     "вложени",   # вложении, вложение
     "скрин",     # скрин, скриншот, скрин-шот
     "screenshot",
@@ -68,9 +76,9 @@ ATTACHMENT_REF_KEYWORDS = [
     "картинк",   # картинка, картинке
     "изображени", # изображение
     "прикреп",   # прикреплен, прикрепил
-]
+)
 
-SPAM_KEYWORDS = [
+SPAM_KEYWORDS = (
     "выгодное предложение",
     "акция",
     "скидк",
@@ -79,9 +87,9 @@ SPAM_KEYWORDS = [
     "в наличии",
     "купите",
     "продаж",
-]
+)
 
-FRAUD_KEYWORDS = [
+FRAUD_KEYWORDS = (
     "мошен",
     "мошенник",
     "скам",
@@ -102,9 +110,9 @@ FRAUD_KEYWORDS = [
     "подмена реквизитов",
     "подозрительн",
     "чужой перевод",
-]
+)
 
-DATA_CHANGE_KEYWORDS = [
+DATA_CHANGE_KEYWORDS = (
     "смен",
     "измен",
     "обнов",
@@ -115,9 +123,9 @@ DATA_CHANGE_KEYWORDS = [
     "e-mail",
     "адрес",
     "почт",
-]
+)
 
-APP_ISSUE_KEYWORDS = [
+APP_ISSUE_KEYWORDS = (
     "не могу войти",
     "не могу зайти",
     "не работает",
@@ -131,9 +139,9 @@ APP_ISSUE_KEYWORDS = [
     "смс",
     "парол",
     "восстановлен",
-]
+)
 
-CLAIM_KEYWORDS = [
+CLAIM_KEYWORDS = (
     "претензи",
     "требую",
     "верните деньги",
@@ -141,9 +149,9 @@ CLAIM_KEYWORDS = [
     "компенсац",
     "в суд",
     "жалоба в",
-]
+)
 
-NEGATIVE_KEYWORDS = [
+NEGATIVE_KEYWORDS = (
     "срочно",
     "не работает",
     "ошибка",
@@ -153,8 +161,8 @@ NEGATIVE_KEYWORDS = [
     "жалоба",
     "проблема",
     "заблок",
-]
-LOSS_RISK_KEYWORDS = [
+)
+LOSS_RISK_KEYWORDS = (
     "потерял деньги",
     "потеряла деньги",
     "потеря денег",
@@ -174,8 +182,8 @@ LOSS_RISK_KEYWORDS = [
     "lost money",
     "funds missing",
     "profit loss",
-]
-LEGAL_RISK_KEYWORDS = [
+)
+LEGAL_RISK_KEYWORDS = (
     "суд",
     "иск",
     "юрист",
@@ -187,37 +195,61 @@ LEGAL_RISK_KEYWORDS = [
     "нацбанк",
     "арбитраж",
     "litigation",
-]
-ACCOUNT_BLOCK_KEYWORDS = [
+)
+ACCOUNT_BLOCK_KEYWORDS = (
     "заблок",
     "блокиров",
     "замороз",
     "ограничен",
     "restricted",
     "blocked",
-]
-LARGE_SUM_KEYWORDS = [
+)
+LARGE_SUM_KEYWORDS = (
     "большая сумма",
     "крупная сумма",
     "миллион",
     "млн",
     "large amount",
-]
-CURRENCY_MARKERS = ["тенге", "kzt", "₸", "usd", "$", "eur", "€", "доллар", "руб", "₽"]
+)
+CURRENCY_MARKERS = ("тенге", "kzt", "₸", "usd", "$", "eur", "€", "доллар", "руб", "₽")
 
 URL_PATTERN = re.compile(r"https?://|www\.", flags=re.IGNORECASE)
-LATIN_PATTERN = re.compile(r"[a-zA-Z]")
-CYRILLIC_PATTERN = re.compile(r"[а-яА-ЯёЁ]")
-KZ_SPECIFIC_PATTERN = re.compile(r"[әіңғүұқөһӘІҢҒҮҰҚӨҺ]")
+NUMBER_PATTERN = re.compile(r"\b\d[\d\s]{2,}\b")
 
-# Language disambiguation patterns for Turkic Latin scripts.
+# Character classes for the single-pass language counter in _lang_counts.
+# Kazakh Cyrillic specifics appear in no other common language here.
+_KZ_SPECIFIC_CHARS = frozenset("әіңғүұқөһӘІҢҒҮҰҚӨҺ")
+# Ҷ (palatal affricate) and Ӯ (Uzbek Cyrillic oʻ) do not appear in Kazakh — distinctly Uzbek.
+_UZ_CYRILLIC_CHARS = frozenset("ҶҷӮӯ")
 # ı (U+0131 dotless i) is the most reliable Azerbaijani Latin marker — absent from Kazakh Latin 2021.
-AZ_LATIN_PATTERN = re.compile(r"ı")           # U+0131 — Azerbaijani Latin
+_AZ_LATIN_CHAR = "ı"
 # ʻ (U+02BB modifier letter turned comma) is unique to Uzbek Latin orthography (oʻ, gʻ).
-UZ_LATIN_PATTERN = re.compile(r"ʻ")           # U+02BB — Uzbek Latin
-# Kazakh Cyrillic Ҷ (U+0546) does not appear in Kazakh; it's distinctly Uzbek Cyrillic.
-UZ_CYRILLIC_PATTERN = re.compile(r"[ҶҷӮӯ]")  # Ҷ = palatal affricate, Ӯ = Uzbek Cyrillic oʻ
-NUMBER_PATTERN = re.compile(r"\b\d[\d\s]{2,}\b")
+_UZ_LATIN_CHAR = "ʻ"
+
+
+def _lang_counts(text: str) -> tuple[int, int, bool, bool, bool, bool]:
+    """
+    Single pass over *text* collecting everything _infer_language needs:
+    (latin_count, cyrillic_count, has_kz, has_uz_cyr, has_az_lat, has_uz_lat).
+    Exits early on a Kazakh-specific character since that alone decides the verdict.
+    """
+    latin = cyrillic = 0
+    has_kz = has_uz_cyr = has_az_lat = has_uz_lat = False
+    for ch in text:
+        if "a" <= ch <= "z" or "A" <= ch <= "Z":
+            latin += 1
+        elif "а" <= ch <= "я" or "А" <= ch <= "Я" or ch == "ё" or ch == "Ё":
+            cyrillic += 1
+        elif ch in _KZ_SPECIFIC_CHARS:
+            has_kz = True
+            break
+        elif ch in _UZ_CYRILLIC_CHARS:
+            has_uz_cyr = True
+        elif ch == _AZ_LATIN_CHAR:
+            has_az_lat = True
+        elif ch == _UZ_LATIN_CHAR:
+            has_uz_lat = True
+    return latin, cyrillic, has_kz, has_uz_cyr, has_az_lat, has_uz_lat
 
 SYSTEM_PROMPT = """You are a customer support classifier for Freedom Finance (Фридом Финанс), a brokerage firm in Kazakhstan. Read the support ticket and output JSON. Do not output anything else.
 
@@ -300,28 +332,25 @@ def _truncate_text(text: str, max_chars: int) -> str:
     return text[:max_chars] + "\n...[truncated for latency]"
 
 
-def _contains_any(text: str, keywords: list[str]) -> bool:
+def _contains_any(text: str, keywords: tuple[str, ...]) -> bool:
     return any(kw in text for kw in keywords)
 
 
 def _infer_language(description: str) -> str:
     if not description:
         return "RU"
+    latin_count, cyr_count, has_kz, has_uz_cyr, has_az_lat, has_uz_lat = _lang_counts(description)
     # Kazakh Cyrillic — highest priority; these chars appear in no other common language.
-    if KZ_SPECIFIC_PATTERN.search(description):
+    if has_kz:
         return "KZ"
     # Uzbek Cyrillic — Ҷ (palatal affricate) and Ӯ (oʻ) are unique to Uzbek.
-    if UZ_CYRILLIC_PATTERN.search(description):
+    if has_uz_cyr:
         return "RU"
-    latin_count = len(LATIN_PATTERN.findall(description))
-    cyr_count = len(CYRILLIC_PATTERN.findall(description))
     if latin_count >= 20 and latin_count > cyr_count:
         # Latin-dominant text — rule out Azerbaijani and Uzbek before calling it English.
-        # ı (U+0131 dotless i) → Azerbaijani Latin → route as RU (no KZ/ENG skill needed).
-        if AZ_LATIN_PATTERN.search(description):
-            return "RU"
-        # ʻ (U+02BB modifier letter turned comma, as in oʻ / gʻ) → Uzbek Latin → route as RU.
-        if UZ_LATIN_PATTERN.search(description):
+        # ı (Azerbaijani Latin) or ʻ (Uzbek Latin, as in oʻ / gʻ) → route as RU
+        # (no KZ/ENG skill needed).
+        if has_az_lat or has_uz_lat:
             return "RU"
         # Kazakh Latin (2021 alphabet) has no single unique character; the LLM handles this
         # edge case via the updated system prompt.  Fall through to ENG so the LLM can
@@ -384,21 +413,26 @@ def _mentions_large_sum(text_lower: str) -> bool:
         return True
 
     has_currency = _contains_any(text_lower, CURRENCY_MARKERS)
-    for raw in NUMBER_PATTERN.findall(text_lower):
-        digits = raw.replace(" ", "")
+    # finditer + early exit: stop at the first qualifying number instead of
+    # materializing every number in the text.  The digit-count check proves
+    # magnitude without int() parsing (7+ digits ⇒ ≥ 1,000,000).
+    for match in NUMBER_PATTERN.finditer(text_lower):
+        digits = match.group().replace(" ", "")
         if not digits.isdigit():
             continue
-        value = int(digits)
-        # High absolute amount, or medium amount when currency is explicitly mentioned.
-        if value >= 1_000_000:
+        n_digits = len(digits)
+        if n_digits >= 7:
             return True
-        if has_currency and value >= 300_000:
+        # Medium amount only counts when currency is explicitly mentioned.
+        if has_currency and n_digits >= 6 and int(digits) >= 300_000:
             return True
     return False
 
 
-def _has_high_impact_signal(description: str, attachment_context: str | None = None) -> bool:
-    text_lower = f"{description or ''} {attachment_context or ''}".lower()
+# The _has_*/_apply_*/_compute_priority helpers all take the already-lowered
+# description+attachment text: callers build it exactly once per classification
+# instead of each helper re-concatenating and re-lowering the same ~KBs.
+def _has_high_impact_signal(text_lower: str) -> bool:
     return (
         _contains_any(text_lower, LEGAL_RISK_KEYWORDS)
         or _contains_any(text_lower, ACCOUNT_BLOCK_KEYWORDS)
@@ -406,24 +440,18 @@ def _has_high_impact_signal(description: str, attachment_context: str | None = N
     )
 
 
-def _has_loss_risk_signal(description: str, attachment_context: str | None = None) -> bool:
-    text_lower = f"{description or ''} {attachment_context or ''}".lower()
+def _has_loss_risk_signal(text_lower: str) -> bool:
     return _contains_any(text_lower, LOSS_RISK_KEYWORDS)
 
 
-def _apply_consultation_guardrail(
-    ticket_type: str,
-    description: str,
-    attachment_context: str | None = None,
-) -> str:
+def _apply_consultation_guardrail(ticket_type: str, text_lower: str) -> str:
     """Prevent risky tickets from being labeled as consultation."""
     if ticket_type != "Консультация":
         return ticket_type
 
-    text_lower = f"{description or ''} {attachment_context or ''}".lower()
     if _contains_any(text_lower, FRAUD_KEYWORDS):
         return "Мошеннические действия"
-    if _has_loss_risk_signal(description, attachment_context) or _has_high_impact_signal(description, attachment_context):
+    if _has_loss_risk_signal(text_lower) or _has_high_impact_signal(text_lower):
         return "Жалоба"
     return ticket_type
 
@@ -432,8 +460,7 @@ def _compute_priority(
     ticket_type: str,
     sentiment: str,
     segment: str,
-    description: str,
-    attachment_context: str | None = None,
+    text_lower: str,
 ) -> int | None:
     if ticket_type == "Спам":
         return None
@@ -443,7 +470,7 @@ def _compute_priority(
         priority = max(priority + 2, 6)
     if sentiment == "Негативный":
         priority += 1
-    if _has_high_impact_signal(description, attachment_context):
+    if _has_high_impact_signal(text_lower):
         priority += 1
     return max(1, min(10, priority))
 
@@ -496,13 +523,15 @@ def _build_heuristic_result(
     ticket_type: str,
     reason: str,
     attachment_context: str | None = None,
+    text_lower: str | None = None,
 ) -> dict:
-    text_lower = (description or "").lower()
+    if text_lower is None:
+        text_lower = (description or "").lower()
     if ticket_type == "Спам":
         sentiment = "Нейтральный"
     else:
         sentiment = _infer_sentiment(text_lower, ticket_type)
-    priority = _compute_priority(ticket_type, sentiment, segment, description or "", attachment_context)
+    priority = _compute_priority(ticket_type, sentiment, segment, text_lower)
 
     return {
         "ticket_type": ticket_type,
@@ -515,6 +544,28 @@ def _build_heuristic_result(
     }
 
 
+# Matched-category bits, ordered by decision priority: the lower the bit, the
+# higher the priority, so the winning category is simply the lowest set bit of
+# the match mask — no Python if/elif ladder needed at dispatch time.
+SPAM_BIT = 1 << 0
+FRAUD_BIT = 1 << 1
+CLAIM_BIT = 1 << 2
+DATA_CHANGE_BIT = 1 << 3
+APP_ISSUE_BIT = 1 << 4
+LOSS_RISK_BIT = 1 << 5
+COMPLAINT_BIT = 1 << 6
+
+_BIT_TO_TYPE: dict[int, tuple[str, str]] = {
+    SPAM_BIT: ("Спам", "spam"),
+    FRAUD_BIT: ("Мошеннические действия", "fraud"),
+    CLAIM_BIT: ("Претензия", "claim"),
+    DATA_CHANGE_BIT: ("Смена данных", "data_change"),
+    APP_ISSUE_BIT: ("Неработоспособность приложения", "app_issue"),
+    LOSS_RISK_BIT: ("Жалоба", "loss_or_risk_signal"),
+    COMPLAINT_BIT: ("Жалоба", "complaint"),
+}
+
+
 def _try_fast_rule_based_classification(
     description: str,
     segment: str,
@@ -525,31 +576,33 @@ def _try_fast_rule_based_classification(
         return None
 
     text_lower = text.lower()
-    has_url = bool(URL_PATTERN.search(text))
-
-    if has_url and _contains_any(text_lower, SPAM_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Спам", "spam", attachment_context)
 
+    mask = 0
+    if _contains_any(text_lower, SPAM_KEYWORDS) and URL_PATTERN.search(text):
+        mask |= SPAM_BIT
     if _contains_any(text_lower, FRAUD_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Мошеннические действия", "fraud", attachment_context)
-
+        mask |= FRAUD_BIT
     if _contains_any(text_lower, CLAIM_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Претензия", "claim", attachment_context)
-
-    data_change_signal = _contains_any(text_lower, DATA_CHANGE_KEYWORDS)
-    if data_change_signal and ("номер" in text_lower or "паспорт" in text_lower or "email" in text_lower or "адрес" in text_lower):
-        return _build_heuristic_result(text, segment, "Смена данных", "data_change", attachment_context)
-
+        mask |= CLAIM_BIT
+    if _contains_any(text_lower, DATA_CHANGE_KEYWORDS) and (
+        "номер" in text_lower or "паспорт" in text_lower or "email" in text_lower or "адрес" in text_lower
+    ):
+        mask |= DATA_CHANGE_BIT
     if _contains_any(text_lower, APP_ISSUE_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Неработоспособность приложения", "app_issue", attachment_context)
-
-    if _has_loss_risk_signal(text, attachment_context) or _has_high_impact_signal(text, attachment_context):
-        return _build_heuristic_result(text, segment, "Жалоба", "loss_or_risk_signal", attachment_context)
-
+        mask |= APP_ISSUE_BIT
+    if _has_loss_risk_signal(text_lower) or _has_high_impact_signal(text_lower):
+        mask |= LOSS_RISK_BIT
     if "!" in text and _contains_any(text_lower, NEGATIVE_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Жалоба", "complaint", attachment_context)
+        mask |= COMPLAINT_BIT
 
-    return None
+    lowest = mask & -mask  # isolate lowest set bit = highest-priority match
+    if not lowest:
+        return None
+
+    ticket_type, reason = _BIT_TO_TYPE[lowest]
+    return _build_heuristic_result(
+        text, segment, ticket_type, reason, attachment_context, text_lower=text_lower
+    )
 
 
 # Strict JSON schema for ticket classification — gpt-5-nano enforces this at the API level,
@@ -585,6 +638,22 @@ TICKET_RESPONSE_FORMAT = {
     },
 }
 
+class TicketResult(msgspec.Struct):
+    """Typed view of the LLM classification payload.
+
+    msgspec decodes and type-checks the model JSON in C, so batch backfills skip
+    the json.loads dict churn; the struct is flattened back to a plain dict only
+    once, for the sanitation/merge steps below.
+    """
+
+    ticket_type: str
+    sentiment: str
+    priority: int | None
+    language: str
+    summary: str
+    recommendation: str
+
+
 IMAGE_PROMPT = (
     "This is a screenshot attached to a customer support ticket for a brokerage app (Freedom Finance). "
     "Describe in 2-3 sentences in Russian what is shown: what screen/feature is visible, "
@@ -741,19 +810,25 @@ def analyze_ticket(
         return {
             "ticket_type": "Консультация",
             "sentiment": "Нейтральный",
-            "priority": _compute_priority("Консультация", "Нейтральный", segment or "Mass", "", None),
+            "priority": _compute_priority("Консультация", "Нейтральный", segment or "Mass", ""),
             "language": "RU",
             "summary": "Обращение без текстового описания и вложения.",
             "recommendation": "Связаться с клиентом для уточнения запроса.",
             "analysis_engine": "fallback:empty",
         }
 
+    # Heuristic result is remembered so the LLM-error fallback below never has to
+    # re-run the keyword sweep: if it already ran and returned None here, it would
+    # return None again.
+    heuristic: dict | None = None
+    heuristic_checked = False
     if ENABLE_FAST_HEURISTICS:
         heuristic = _try_fast_rule_based_classification(
             description=description or "",
             segment=segment or "Mass",
             attachment_context=attachment_context,
         )
+        heuristic_checked = True
         if heuristic is not None:
             _ensure_summary_and_recommendation(
                 heuristic,
@@ -814,22 +889,27 @@ Description:
             raise ValueError(
                 f"Empty response from LLM — finish_reason={choice.finish_reason!r}, refusal={refusal!r}"
             )
-        result = json.loads(content)
+        # strict=False tolerates extra fields / numeric strings from the model.
+        parsed = msgspec.json.decode(content.encode(), type=TicketResult, strict=False)
+        result = msgspec.structs.asdict(parsed)
         result["language"] = _normalize_language(result.get("language", ""))
         result["analysis_engine"] = f"llm:{MODEL}"
 
     except Exception as llm_err:
         print(f"[LLM] Fast-path error: {llm_err}. Returning deterministic fallback.")
         fallback_type = "Консультация"
-        heuristic_fallback = _try_fast_rule_based_classification(
-            description=description or "",
-            segment=segment or "Mass",
-            attachment_context=attachment_context,
-        )
-        if heuristic_fallback is not None:
-            fallback_type = heuristic_fallback.get("ticket_type", fallback_type)
-        fallback_type = _apply_consultation_guardrail(fallback_type, description or "", attachment_context)
-        fallback_sentiment = _infer_sentiment((description or "").lower(), fallback_type)
+        if not heuristic_checked:
+            heuristic = _try_fast_rule_based_classification(
+                description=description or "",
+                segment=segment or "Mass",
+                attachment_context=attachment_context,
+            )
+        if heuristic is not None:
+            fallback_type = heuristic.get("ticket_type", fallback_type)
+        desc_lower = (description or "").lower()
+        text_lower = f"{desc_lower} {attachment_context.lower()}" if attachment_context else desc_lower
+        fallback_type = _apply_consultation_guardrail(fallback_type, text_lower)
+        fallback_sentiment = _infer_sentiment(desc_lower, fallback_type)
         if fallback_type == "Спам":
             fallback_sentiment = "Нейтральный"
         result = {
@@ -839,8 +919,7 @@ Description:
                 fallback_type,
                 fallback_sentiment,
                 segment or "Mass",
-                description or "",
-                attachment_context,
+                text_lower,
             ),
             "language": _infer_language(description or ""),
             "summary": "Ошибка LLM анализа. Требуется ручная проверка обращения.",
@@ -855,26 +934,23 @@ Description:
         return result
 
     # Validate and sanitize required fields
-    valid_types = set(TICKET_TYPES)
-    valid_sentiments = {"Позитивный", "Нейтральный", "Негативный"}
-
-    if result.get("ticket_type") not in valid_types:
+    desc_lower = (description or "").lower()
+    text_lower = f"{desc_lower} {attachment_context.lower()}" if attachment_context else desc_lower
+    if result.get("ticket_type") not in VALID_TICKET_TYPES:
         result["ticket_type"] = "Консультация"
     result["ticket_type"] = _apply_consultation_guardrail(
         result.get("ticket_type", "Консультация"),
-        description or "",
-        attachment_context,
+        text_lower,
     )
-    if result.get("sentiment") not in valid_sentiments:
-        result["sentiment"] = _infer_sentiment((description or "").lower(), result.get("ticket_type", "Консультация"))
+    if result.get("sentiment") not in VALID_SENTIMENTS:
+        result["sentiment"] = _infer_sentiment(desc_lower, result.get("ticket_type", "Консультация"))
     if result.get("ticket_type") == "Спам":
         result["sentiment"] = "Нейтральный"
     result["priority"] = _compute_priority(
         result.get("ticket_type", "Консультация"),
         result.get("sentiment", "Нейтральный"),
         segment or "Mass",
-        description or "",
-        attachment_context,
+        text_lower,
     )
     _ensure_summary_and_recommendation(
         result,
@@ -885,6 +961,62 @@ Description:
     return result
 
 
+# Concurrency of one analyze_tickets_batch dispatch. 16 matches BATCH_SIZE in
+# the pipeline, so a full batch goes out in one wave; lower it if the API tier
+# rate-limits.
+BATCH_MAX_WORKERS = int(os.getenv("LLM_BATCH_MAX_WORKERS", "16"))
+
+
+def analyze_tickets_batch(items: list[dict]) -> list[dict]:
+    """
+    Analyze a micro-batch of tickets in one dispatch.
+
+    The chat completions API takes one prompt per request, so the batch is
+    fanned out over a thread pool and the server batches the concurrent
+    requests on its side. Longest descriptions are submitted first so the
+    slowest prompts never start last, and each item carries its own fallback —
+    one bad prompt cannot poison the rest of the batch.
+
+    Each item: {"description", "segment", "country", "attachment_context"}.
+    Results come back in the same order as *items*.
+    """
+    results: list[dict | None] = [None] * len(items)
+    order = sorted(
+        range(len(items)),
+        key=lambda i: len(items[i].get("description") or ""),
+        reverse=True,
+    )
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, max(1, len(items)))) as executor:
+        futures = {
+            executor.submit(
+                analyze_ticket,
+                description=items[i].get("description") or "",
+                segment=items[i].get("segment") or "Mass",
+                country=items[i].get("country") or "",
+                attachment_context=items[i].get("attachment_context"),
+            ): i
+            for i in order
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as err:
+                # analyze_ticket has its own fallbacks; this only catches
+                # executor-level failures.
+                print(f"[LLM] Batch item error: {err}. Returning deterministic fallback.")
+                results[i] = {
+                    "ticket_type": "Консультация",
+                    "sentiment": "Нейтральный",
+                    "priority": 5,
+                    "language": "RU",
+                    "summary": "Ошибка LLM анализа. Требуется ручная проверка обращения.",
+                    "recommendation": "Провести ручную классификацию и проверить доступность LLM-сервиса.",
+                    "analysis_engine": "fallback:batch_error",
+                }
+    return results
+
+
 def run_assistant_query(query: str, db_context: str) -> dict:
     """Run a natural language query and return chart instructions."""
     system = """You are a data analyst assistant for the FIRE ticket routing system.
@@ -1,47 +1,55 @@
-"""
-llm_local.py — Local LLM variant using Qwen2.5 7B Instruct via Ollama.
-
+"""
+llm_local.py — Local LLM variant using Qwen2.5 7B Instruct via Ollama.
+
 Drop-in replacement for llm.py, adapted for a non-reasoning local model:
   - No reasoning_effort parameter
   - max_tokens instead of max_completion_tokens
   - response_format={"type": "json_object"} (Ollama doesn't support json_schema)
   - Explicit JSON example at the end of the system prompt (Qwen follows examples well)
   - Optional image analysis via a separate VL model (LOCAL_LLM_VISION_MODEL)
-
-Usage:
-  # Pull the model first (one-time):
-  ollama pull qwen2.5:7b-instruct
-
-  # Start Ollama (if not already running):
-  ollama serve
-
-  # Use as a module:
-  from llm_local import analyze_ticket, get_attachment_context, run_assistant_query
-"""
-
+
+Usage:
+  # Pull the model first (one-time):
+  ollama pull qwen2.5:7b-instruct
+
+  # Start Ollama (if not already running):
+  ollama serve
+
+  # Use as a module:
+  from llm_local import analyze_ticket, get_attachment_context, run_assistant_query
+"""
+
 import os
 import json
 import re
 import io
 import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
 from openai import OpenAI
 from dotenv import load_dotenv
-
-load_dotenv()
-
-# ---------------------------------------------------------------------------
-# Client — Ollama exposes an OpenAI-compatible API at port 11434.
-# Override via env vars to point at LM Studio, vLLM, or any other local server.
-# ---------------------------------------------------------------------------
-LOCAL_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:11434/v1")
-LOCAL_API_KEY = os.getenv("LOCAL_LLM_API_KEY", "ollama")  # Ollama ignores the key
-
-client = OpenAI(
-    api_key=LOCAL_API_KEY,
-    base_url=LOCAL_BASE_URL,
-)
-
-# Ollama model tag — pull with: ollama pull qwen2.5:7b-instruct
+
+load_dotenv()
+
+# ---------------------------------------------------------------------------
+# Client — Ollama exposes an OpenAI-compatible API at port 11434.
+# Override via env vars to point at LM Studio, vLLM, or any other local server.
+# ---------------------------------------------------------------------------
+LOCAL_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:11434/v1")
+LOCAL_API_KEY = os.getenv("LOCAL_LLM_API_KEY", "ollama")  # Ollama ignores the key
+
+# Native Ollama API root (no /v1 suffix) — used for vision calls, where the native
+# `images: [b64]` field avoids wrapping the payload in a data URL that the OpenAI SDK
+# would re-serialize (one extra ~300 KB string copy per screenshot).
+OLLAMA_API_URL = os.getenv("LOCAL_LLM_OLLAMA_API_URL", LOCAL_BASE_URL.removesuffix("/v1"))
+
+client = OpenAI(
+    api_key=LOCAL_API_KEY,
+    base_url=LOCAL_BASE_URL,
+)
+
+# Ollama model tag — pull with: ollama pull qwen2.5:7b-instruct
 MODEL = os.getenv("LOCAL_LLM_MODEL", "qwen2.5:7b-instruct")
 ASSISTANT_MODEL = os.getenv("LOCAL_LLM_ASSISTANT_MODEL", MODEL)
 VISION_MODEL = os.getenv("LOCAL_LLM_VISION_MODEL", "qwen2.5vl:7b")
@@ -55,101 +63,128 @@ VISION_MAX_TOKENS = int(os.getenv("LOCAL_LLM_VISION_MAX_TOKENS", "220"))
 MAX_DESCRIPTION_CHARS = int(os.getenv("LOCAL_LLM_MAX_DESCRIPTION_CHARS", "1200"))
 MAX_ATTACHMENT_CTX_CHARS = int(os.getenv("LOCAL_LLM_MAX_ATTACHMENT_CTX_CHARS", "700"))
 IMAGE_MAX_SIDE_PX = int(os.getenv("LOCAL_LLM_IMAGE_MAX_SIDE_PX", "768"))
-
-ATTACHMENTS_SUBDIR = "images"
-DEFAULT_IMAGE_EXT = ".png"
-
-# ---------------------------------------------------------------------------
-# Ticket type constants (shared with routing.py)
-# ---------------------------------------------------------------------------
-TICKET_TYPES = [
-    "Жалоба",
-    "Смена данных",
-    "Консультация",
-    "Претензия",
-    "Неработоспособность приложения",
-    "Мошеннические действия",
-    "Спам",
-]
-
-# ---------------------------------------------------------------------------
-# Fast heuristics (identical to llm.py — language-independent)
-# ---------------------------------------------------------------------------
-ATTACHMENT_REF_KEYWORDS = [
-    "вложени", "скрин", "screenshot", "attached", "attachment",
-    "см. скрин", "фото", "photo", "картинк", "изображени", "прикреп",
-]
-SPAM_KEYWORDS = [
-    "выгодное предложение", "акция", "скидк", "реклама",
-    "оборудовани", "в наличии", "купите", "продаж",
-]
-FRAUD_KEYWORDS = [
+
+ATTACHMENTS_SUBDIR = "images"
+DEFAULT_IMAGE_EXT = ".png"
+
+# ---------------------------------------------------------------------------
+# Ticket type constants (shared with routing.py)
+# ---------------------------------------------------------------------------
+TICKET_TYPES = [
+    "Жалоба",
+    "Смена данных",
+    "Консультация",
+    "Претензия",
+    "Неработоспособность приложения",
+    "Мошеннические действия",
+    "Спам",
+]
+
+# Precomputed validation sets — analyze_ticket runs once per ticket, so don't
+# rebuild these on every call.
+VALID_TICKET_TYPES = frozenset(TICKET_TYPES)
+VALID_SENTIMENTS = frozenset({"Позитивный", "Нейтральный", "Негативный"})
+
+# ---------------------------------------------------------------------------
+# Fast heuristics (identical to llm.py — language-independent)
+# ---------------------------------------------------------------------------
+ATTACHMENT_REF_KEYWORDS = (
+    "вложени", "скрин", "screenshot", "attached", "attachment",
+    "см. скрин", "фото", "photo", "картинк", "изображени", "прикреп",
+)
+SPAM_KEYWORDS = (
+    "выгодное предложение", "акция", "скидк", "реклама",
+    "оборудовани", "в наличии", "купите", "продаж",
+)
+FRAUD_KEYWORDS = (
     "мошен", "мошенник", "скам", "scam", "развод", "обман",
     "фишинг", "phishing", "не санкционирован", "несанкционирован",
     "неизвестн", "без моего ведома", "без моего согласия",
     "украли", "украден", "взлом", "поддел", "подмена реквизитов",
     "подозрительн", "чужой перевод",
-]
-DATA_CHANGE_KEYWORDS = [
-    "смен", "измен", "обнов", "номер телефона", "телефон",
-    "паспорт", "email", "e-mail", "адрес", "почт",
-]
-APP_ISSUE_KEYWORDS = [
+)
+DATA_CHANGE_KEYWORDS = (
+    "смен", "измен", "обнов", "номер телефона", "телефон",
+    "паспорт", "email", "e-mail", "адрес", "почт",
+)
+APP_ISSUE_KEYWORDS = (
     "не могу войти", "не могу зайти", "не работает", "ошибк",
     "app", "приложен", "сбой", "bug", "крэш", "crash",
     "смс", "парол", "восстановлен",
-]
-CLAIM_KEYWORDS = [
-    "претензи", "требую", "верните деньги", "возврат",
-    "компенсац", "в суд", "жалоба в",
-]
-NEGATIVE_KEYWORDS = [
+)
+CLAIM_KEYWORDS = (
+    "претензи", "требую", "верните деньги", "возврат",
+    "компенсац", "в суд", "жалоба в",
+)
+NEGATIVE_KEYWORDS = (
     "срочно", "не работает", "ошибка", "невозможно",
     "неправомерно", "возмущен", "жалоба", "проблема", "заблок",
-]
-LOSS_RISK_KEYWORDS = [
+)
+LOSS_RISK_KEYWORDS = (
     "потерял деньги", "потеряла деньги", "потеря денег", "потеря прибыли",
     "убыт", "пропали деньги", "деньги исчезли", "списали деньги",
     "списание без", "не пришли деньги", "не поступили деньги",
     "не получил деньги", "не получила деньги", "не могу вывести",
     "не выводятся", "застряли деньги", "lost money", "funds missing",
     "profit loss",
-]
-LEGAL_RISK_KEYWORDS = [
+)
+LEGAL_RISK_KEYWORDS = (
     "суд", "иск", "юрист", "адвокат", "прокурат", "регулятор",
     "комитет", "цб", "нацбанк", "арбитраж", "litigation",
-]
-ACCOUNT_BLOCK_KEYWORDS = [
+)
+ACCOUNT_BLOCK_KEYWORDS = (
     "заблок", "блокиров", "замороз", "ограничен", "restricted", "blocked",
-]
-LARGE_SUM_KEYWORDS = [
+)
+LARGE_SUM_KEYWORDS = (
     "большая сумма", "крупная сумма", "миллион", "млн", "large amount",
-]
-CURRENCY_MARKERS = ["тенге", "kzt", "₸", "usd", "$", "eur", "€", "доллар", "руб", "₽"]
+)
+CURRENCY_MARKERS = ("тенге", "kzt", "₸", "usd", "$", "eur", "€", "доллар", "руб", "₽")
 
 URL_PATTERN = re.compile(r"https?://|www\.", flags=re.IGNORECASE)
-LATIN_PATTERN = re.compile(r"[a-zA-Z]")
-CYRILLIC_PATTERN = re.compile(r"[а-яА-ЯёЁ]")
-KZ_SPECIFIC_PATTERN = re.compile(r"[әіңғүұқөһӘІҢҒҮҰҚӨҺ]")
-AZ_LATIN_PATTERN = re.compile(r"ı")
-UZ_LATIN_PATTERN = re.compile(r"ʻ")
-UZ_CYRILLIC_PATTERN = re.compile(r"[ҶҷӮӯ]")
 NUMBER_PATTERN = re.compile(r"\b\d[\d\s]{2,}\b")
-
-# ---------------------------------------------------------------------------
-# System prompt — adapted for Qwen2.5 7B Instruct.
-#
-# Key differences from llm.py:
-#   1. Shorter, more imperative phrasing (Qwen is a chat model, not a reasoner).
-#   2. Explicit "Output ONLY the JSON" instruction at the top AND bottom.
-#   3. Full JSON example at the end — Qwen follows concrete examples very reliably.
-#   4. No XML-style tags (the original used them for clarity; they work fine with Qwen
-#      but a flat numbered list tends to be more robust for 7B-scale models).
-# ---------------------------------------------------------------------------
-SYSTEM_PROMPT = """You are a ticket classifier for Freedom Finance (Kazakhstan brokerage).
-Read the support ticket and output ONLY a JSON object — no explanation, no markdown, no extra text.
-
-TICKET_TYPE — choose exactly one:
+
+# Character classes for the single-pass language counter (identical to llm.py).
+_KZ_SPECIFIC_CHARS = frozenset("әіңғүұқөһӘІҢҒҮҰҚӨҺ")
+_UZ_CYRILLIC_CHARS = frozenset("ҶҷӮӯ")
+_AZ_LATIN_CHAR = "ı"
+_UZ_LATIN_CHAR = "ʻ"
+
+
+def _lang_counts(text: str) -> tuple[int, int, bool, bool, bool, bool]:
+    """Single pass over *text* collecting everything _infer_language needs
+    (identical to llm.py)."""
+    latin = cyrillic = 0
+    has_kz = has_uz_cyr = has_az_lat = has_uz_lat = False
+    for ch in text:
+        if "a" <= ch <= "z" or "A" <= ch <= "Z":
+            latin += 1
+        elif "а" <= ch <= "я" or "А" <= ch <= "Я" or ch == "ё" or ch == "Ё":
+            cyrillic += 1
+        elif ch in _KZ_SPECIFIC_CHARS:
+            has_kz = True
+            break
+        elif ch in _UZ_CYRILLIC_CHARS:
+            has_uz_cyr = True
+        elif ch == _AZ_LATIN_CHAR:
+            has_az_lat = True
+        elif ch == _UZ_LATIN_CHAR:
+            has_uz_lat = True
+    return latin, cyrillic, has_kz, has_uz_cyr, has_az_lat, has_uz_lat
+
+# ---------------------------------------------------------------------------
+# System prompt — adapted for Qwen2.5 7B Instruct.
+#
+# Key differences from llm.py:
+#   1. Shorter, more imperative phrasing (Qwen is a chat model, not a reasoner).
+#   2. Explicit "Output ONLY the JSON" instruction at the top AND bottom.
+#   3. Full JSON example at the end — Qwen follows concrete examples very reliably.
+#   4. No XML-style tags (the original used them for clarity; they work fine with Qwen
+#      but a flat numbered list tends to be more robust for 7B-scale models).
+# ---------------------------------------------------------------------------
+SYSTEM_PROMPT = """You are a ticket classifier for Freedom Finance (Kazakhstan brokerage).
+Read the support ticket and output ONLY a JSON object — no explanation, no markdown, no extra text.
+
+TICKET_TYPE — choose exactly one:
 1. "Жалоба"                         — general dissatisfaction, no demand for money
 2. "Претензия"                      — formal claim demanding refund/compensation ("требую", "верните", "претензия")
 3. "Смена данных"                   — request to change phone, passport, address, or email
@@ -171,95 +206,92 @@ CONSULTATION GUARDRAIL:
 - Use "Консультация" only if the ticket asks for explanation/instructions and has no red flags.
 - Red flags: missing money, loss/profit loss, unauthorized transfer, suspicious third party, blocked/disappeared funds, request to investigate or return money.
 - If red flags exist, do NOT use "Консультация"; choose "Мошеннические действия" or "Жалоба/Претензия".
-
-SENTIMENT — choose exactly one:
-- "Позитивный" — satisfied or grateful
-- "Нейтральный" — factual / neutral (always use for Спам)
-- "Негативный"  — angry, frustrated, upset
-
+
+SENTIMENT — choose exactly one:
+- "Позитивный" — satisfied or grateful
+- "Нейтральный" — factual / neutral (always use for Спам)
+- "Негативный"  — angry, frustrated, upset
+
 LANGUAGE — write the full language name in English:
 - If text contains ә і ң ғ ү ұ қ ө һ → "Kazakh"
 - If text is English → "English"
 - If text is Russian (or unrecognized) → "Russian"
 - Other: "Uzbek", "Azerbaijani", etc.
-
-PRIORITY — integer 1–10, or null for Спам:
-  Base: Мошеннические действия=9, Претензия=8, Жалоба=6, Неработоспособность=6,
-        Смена данных=5, Консультация=3, Спам=null
-  Add +2 if segment is VIP or Priority (floor 6); +1 if Негативный; +1 if legal action / large sum.
-  Cap at 10.
-
+
+PRIORITY — integer 1–10, or null for Спам:
+  Base: Мошеннические действия=9, Претензия=8, Жалоба=6, Неработоспособность=6,
+        Смена данных=5, Консультация=3, Спам=null
+  Add +2 if segment is VIP or Priority (floor 6); +1 if Негативный; +1 if legal action / large sum.
+  Cap at 10.
+
 SUMMARY — 1–2 sentences in Russian describing the issue.
 RECOMMENDATION — 1 sentence in Russian telling the manager what to do.
-
-Output format (JSON only, no other text):
-{"ticket_type": "...", "sentiment": "...", "priority": 5, "language": "...", "summary": "...", "recommendation": "..."}"""
-
-
-# ---------------------------------------------------------------------------
-# Helper utilities (identical to llm.py)
-# ---------------------------------------------------------------------------
-
-def references_attachment(description: str) -> bool:
-    if not description:
-        return False
-    desc_lower = description.lower()
-    return any(kw in desc_lower for kw in ATTACHMENT_REF_KEYWORDS)
-
-
-def _truncate_text(text: str, max_chars: int) -> str:
-    if len(text) <= max_chars:
-        return text
-    return text[:max_chars] + "\n...[truncated]"
-
-
-def _contains_any(text: str, keywords: list[str]) -> bool:
+
+Output format (JSON only, no other text):
+{"ticket_type": "...", "sentiment": "...", "priority": 5, "language": "...", "summary": "...", "recommendation": "..."}"""
+
+
+# ---------------------------------------------------------------------------
+# Helper utilities (identical to llm.py)
+# ---------------------------------------------------------------------------
+
+def references_attachment(description: str) -> bool:
+    if not description:
+        return False
+    desc_lower = description.lower()
+    return any(kw in desc_lower for kw in ATTACHMENT_REF_KEYWORDS)
+
+
+def _truncate_text(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "\n...[truncated]"
+
+
+def _contains_any(text: str, keywords: tuple[str, ...]) -> bool:
     return any(kw in text for kw in keywords)
 
 
 def _infer_language(description: str) -> str:
     if not description:
         return "RU"
-    if KZ_SPECIFIC_PATTERN.search(description):
+    latin_count, cyr_count, has_kz, has_uz_cyr, has_az_lat, has_uz_lat = _lang_counts(description)
+    if has_kz:
         return "KZ"
-    if UZ_CYRILLIC_PATTERN.search(description):
+    if has_uz_cyr:
         return "RU"
-    latin_count = len(LATIN_PATTERN.findall(description))
-    cyr_count = len(CYRILLIC_PATTERN.findall(description))
     if latin_count >= 20 and latin_count > cyr_count:
-        if AZ_LATIN_PATTERN.search(description):
-            return "RU"
-        if UZ_LATIN_PATTERN.search(description):
+        if has_az_lat or has_uz_lat:
             return "RU"
         return "ENG"
     return "RU"
-
-
-def _normalize_language(lang: str) -> str:
-    lower = (lang or "").strip().lower()
-    if lower in {"kazakh", "kz", "казахский", "kazak", "qazaq", "қазақша"}:
-        return "KZ"
-    if lower in {"english", "eng", "en", "английский"}:
-        return "ENG"
-    return "RU"
-
-
-def _infer_sentiment(text_lower: str, ticket_type: str) -> str:
-    if ticket_type in {"Претензия", "Жалоба", "Мошеннические действия"}:
-        return "Негативный"
-    if _contains_any(text_lower, NEGATIVE_KEYWORDS):
-        return "Негативный"
-    return "Нейтральный"
-
-
+
+
+def _normalize_language(lang: str) -> str:
+    lower = (lang or "").strip().lower()
+    if lower in {"kazakh", "kz", "казахский", "kazak", "qazaq", "қазақша"}:
+        return "KZ"
+    if lower in {"english", "eng", "en", "английский"}:
+        return "ENG"
+    return "RU"
+
+
+def _infer_sentiment(text_lower: str, ticket_type: str) -> str:
+    if ticket_type in {"Претензия", "Жалоба", "Мошеннические действия"}:
+        return "Негативный"
+    if _contains_any(text_lower, NEGATIVE_KEYWORDS):
+        return "Негативный"
+    return "Нейтральный"
+
+
 def _base_priority(ticket_type: str) -> int:
     return {
         "Мошеннические действия": 9,
         "Претензия": 8,
-        "Жалоба": 6,
-        "Неработоспособность приложения": 6,
-        "Смена данных": 5,
-        "Консультация": 3,
+        "Жалоба": 6,
+        "Неработоспособность приложения": 6,
+        "Смена данных": 5,
+        "Консультация": 3,
         "Спам": 1,
     }.get(ticket_type, 5)
 
@@ -269,21 +301,25 @@ def _mentions_large_sum(text_lower: str) -> bool:
         return True
 
     has_currency = _contains_any(text_lower, CURRENCY_MARKERS)
-    for raw in NUMBER_PATTERN.findall(text_lower):
-        digits = raw.replace(" ", "")
+    # finditer + early exit: stop at the first qualifying number instead of
+    # materializing every number in the text.  The digit-count check proves
+    # magnitude without int() parsing (7+ digits ⇒ ≥ 1,000,000).
+    for match in NUMBER_PATTERN.finditer(text_lower):
+        digits = match.group().replace(" ", "")
         if not digits.isdigit():
             continue
-        value = int(digits)
-        # High absolute amount, or medium amount when currency is explicitly mentioned.
-        if value >= 1_000_000:
+        n_digits = len(digits)
+        if n_digits >= 7:
             return True
-        if has_currency and value >= 300_000:
+        # Medium amount only counts when currency is explicitly mentioned.
+        if has_currency and n_digits >= 6 and int(digits) >= 300_000:
             return True
     return False
 
 
-def _has_high_impact_signal(description: str, attachment_context: str | None = None) -> bool:
-    text_lower = f"{description or ''} {attachment_context or ''}".lower()
+# These helpers take the already-lowered description+attachment text so the
+# concat+lower happens once per classification (identical to llm.py).
+def _has_high_impact_signal(text_lower: str) -> bool:
     return (
         _contains_any(text_lower, LEGAL_RISK_KEYWORDS)
         or _contains_any(text_lower, ACCOUNT_BLOCK_KEYWORDS)
@@ -291,23 +327,17 @@ def _has_high_impact_signal(description: str, attachment_context: str | None = N
     )
 
 
-def _has_loss_risk_signal(description: str, attachment_context: str | None = None) -> bool:
-    text_lower = f"{description or ''} {attachment_context or ''}".lower()
+def _has_loss_risk_signal(text_lower: str) -> bool:
     return _contains_any(text_lower, LOSS_RISK_KEYWORDS)
 
 
-def _apply_consultation_guardrail(
-    ticket_type: str,
-    description: str,
-    attachment_context: str | None = None,
-) -> str:
+def _apply_consultation_guardrail(ticket_type: str, text_lower: str) -> str:
     if ticket_type != "Консультация":
         return ticket_type
 
-    text_lower = f"{description or ''} {attachment_context or ''}".lower()
     if _contains_any(text_lower, FRAUD_KEYWORDS):
         return "Мошеннические действия"
-    if _has_loss_risk_signal(description, attachment_context) or _has_high_impact_signal(description, attachment_context):
+    if _has_loss_risk_signal(text_lower) or _has_high_impact_signal(text_lower):
         return "Жалоба"
     return ticket_type
 
@@ -316,8 +346,7 @@ def _compute_priority(
     ticket_type: str,
     sentiment: str,
     segment: str,
-    description: str,
-    attachment_context: str | None = None,
+    text_lower: str,
 ) -> int | None:
     if ticket_type == "Спам":
         return None
@@ -327,7 +356,7 @@ def _compute_priority(
         priority = max(priority + 2, 6)
     if sentiment == "Негативный":
         priority += 1
-    if _has_high_impact_signal(description, attachment_context):
+    if _has_high_impact_signal(text_lower):
         priority += 1
     return max(1, min(10, priority))
 
@@ -379,15 +408,17 @@ def _build_heuristic_result(
     segment: str,
     ticket_type: str,
     reason: str,
-    attachment_context: str | None = None,
+    attachment_context: str | None = None,
+    text_lower: str | None = None,
 ) -> dict:
-    text_lower = (description or "").lower()
+    if text_lower is None:
+        text_lower = (description or "").lower()
     if ticket_type == "Спам":
         sentiment = "Нейтральный"
     else:
         sentiment = _infer_sentiment(text_lower, ticket_type)
-    priority = _compute_priority(ticket_type, sentiment, segment, description or "", attachment_context)
-
+    priority = _compute_priority(ticket_type, sentiment, segment, text_lower)
+
     return {
         "ticket_type": ticket_type,
         "sentiment": sentiment,
@@ -397,8 +428,30 @@ def _build_heuristic_result(
         "recommendation": _default_recommendation(ticket_type),
         "analysis_engine": f"heuristic:{reason}",
     }
-
-
+
+
+# Matched-category bits, ordered by decision priority: the lower the bit, the
+# higher the priority, so the winning category is simply the lowest set bit of
+# the match mask — no Python if/elif ladder needed at dispatch time.
+SPAM_BIT = 1 << 0
+FRAUD_BIT = 1 << 1
+CLAIM_BIT = 1 << 2
+DATA_CHANGE_BIT = 1 << 3
+APP_ISSUE_BIT = 1 << 4
+LOSS_RISK_BIT = 1 << 5
+COMPLAINT_BIT = 1 << 6
+
+_BIT_TO_TYPE: dict[int, tuple[str, str]] = {
+    SPAM_BIT: ("Спам", "spam"),
+    FRAUD_BIT: ("Мошеннические действия", "fraud"),
+    CLAIM_BIT: ("Претензия", "claim"),
+    DATA_CHANGE_BIT: ("Смена данных", "data_change"),
+    APP_ISSUE_BIT: ("Неработоспособность приложения", "app_issue"),
+    LOSS_RISK_BIT: ("Жалоба", "loss_or_risk_signal"),
+    COMPLAINT_BIT: ("Жалоба", "complaint"),
+}
+
+
 def _try_fast_rule_based_classification(
     description: str,
     segment: str,
@@ -408,27 +461,35 @@ def _try_fast_rule_based_classification(
     if not text:
         return None
     text_lower = text.lower()
-    has_url = bool(URL_PATTERN.search(text))
-
-    if has_url and _contains_any(text_lower, SPAM_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Спам", "spam", attachment_context)
-    if _contains_any(text_lower, FRAUD_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Мошеннические действия", "fraud", attachment_context)
-    if _contains_any(text_lower, CLAIM_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Претензия", "claim", attachment_context)
-    if _contains_any(text_lower, DATA_CHANGE_KEYWORDS) and (
-        "номер" in text_lower or "паспорт" in text_lower or "email" in text_lower or "адрес" in text_lower
-    ):
-        return _build_heuristic_result(text, segment, "Смена данных", "data_change", attachment_context)
+
+    mask = 0
+    if _contains_any(text_lower, SPAM_KEYWORDS) and URL_PATTERN.search(text):
+        mask |= SPAM_BIT
+    if _contains_any(text_lower, FRAUD_KEYWORDS):
+        mask |= FRAUD_BIT
+    if _contains_any(text_lower, CLAIM_KEYWORDS):
+        mask |= CLAIM_BIT
+    if _contains_any(text_lower, DATA_CHANGE_KEYWORDS) and (
+        "номер" in text_lower or "паспорт" in text_lower or "email" in text_lower or "адрес" in text_lower
+    ):
+        mask |= DATA_CHANGE_BIT
     if _contains_any(text_lower, APP_ISSUE_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Неработоспособность приложения", "app_issue", attachment_context)
-    if _has_loss_risk_signal(text, attachment_context) or _has_high_impact_signal(text, attachment_context):
-        return _build_heuristic_result(text, segment, "Жалоба", "loss_or_risk_signal", attachment_context)
+        mask |= APP_ISSUE_BIT
+    if _has_loss_risk_signal(text_lower) or _has_high_impact_signal(text_lower):
+        mask |= LOSS_RISK_BIT
     if "!" in text and _contains_any(text_lower, NEGATIVE_KEYWORDS):
-        return _build_heuristic_result(text, segment, "Жалоба", "complaint", attachment_context)
-    return None
-
-
+        mask |= COMPLAINT_BIT
+
+    lowest = mask & -mask  # isolate lowest set bit = highest-priority match
+    if not lowest:
+        return None
+
+    ticket_type, reason = _BIT_TO_TYPE[lowest]
+    return _build_heuristic_result(
+        text, segment, ticket_type, reason, attachment_context, text_lower=text_lower
+    )
+
+
 # ---------------------------------------------------------------------------
 # Vision (optional, uses a dedicated VL model)
 # ---------------------------------------------------------------------------
@@ -472,92 +533,87 @@ def analyze_image(image_path: str) -> str:
     except Exception as err:
         return f"[Ошибка подготовки изображения: {err}]"
 
+    # Native Ollama /api/generate with a top-level `images` field: the base64 string
+    # goes into the JSON body as-is, instead of being embedded in a data URL that the
+    # OpenAI SDK re-concatenates and re-serializes (double-encoding the payload).
     try:
-        response = client.chat.completions.create(
-            model=VISION_MODEL,
-            max_tokens=VISION_MAX_TOKENS,
-            temperature=0.1,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": VISION_PROMPT},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{mime};base64,{img_data}",
-                                "detail": "low",
-                            },
-                        },
-                    ],
-                }
-            ],
+        response = httpx.post(
+            f"{OLLAMA_API_URL}/api/generate",
+            json={
+                "model": VISION_MODEL,
+                "prompt": VISION_PROMPT,
+                "images": [img_data],
+                "stream": False,
+                "options": {"temperature": 0.1, "num_predict": VISION_MAX_TOKENS},
+            },
+            timeout=120.0,
         )
-        content = (response.choices[0].message.content or "").strip()
+        response.raise_for_status()
+        content = (response.json().get("response") or "").strip()
         if not content:
             return f"[Пустой ответ vision-модели {VISION_MODEL}]"
         return content
     except Exception as err:
         return f"[Ошибка анализа изображения моделью {VISION_MODEL}: {err}]"
-
-
-def _resolve_attachment_path(attachment_filename: str, data_dir: str) -> str | None:
-    raw_name = attachment_filename.strip()
-    if not raw_name:
-        return None
-    normalized = os.path.normpath(raw_name).replace("\\", "/")
-    basename = os.path.basename(normalized)
-    images_dir = os.path.join(data_dir, ATTACHMENTS_SUBDIR)
-    candidates: list[str] = []
-
-    def add(path: str):
-        if path not in candidates:
-            candidates.append(path)
-
-    parts = normalized.split("/")
-    if not os.path.isabs(normalized) and ".." not in parts:
-        add(os.path.join(data_dir, normalized))
-    add(os.path.join(images_dir, basename))
-    add(os.path.join(data_dir, basename))
-
-    name_root, ext = os.path.splitext(basename)
-    if basename and not ext:
-        add(os.path.join(images_dir, f"{name_root}{DEFAULT_IMAGE_EXT}"))
-        add(os.path.join(data_dir, f"{name_root}{DEFAULT_IMAGE_EXT}"))
-
-    for path in candidates:
-        if os.path.isfile(path):
-            return path
-    return None
-
-
-def get_attachment_context(
-    attachment_filename: str | None,
-    description: str | None,
-    data_dir: str,
-) -> str | None:
-    if attachment_filename:
-        image_path = _resolve_attachment_path(attachment_filename, data_dir)
-        if image_path:
-            description_text = analyze_image(image_path)
-            rel_path = os.path.relpath(image_path, data_dir).replace("\\", "/")
-            return f"Вложение '{rel_path}': {description_text}"
-        return (
-            f"⚠️ Указан файл вложения '{attachment_filename}', "
-            f"но файл не найден в 'data/{ATTACHMENTS_SUBDIR}/' (или legacy пути data/)."
-        )
-    if references_attachment(description):
-        return (
-            "⚠️ Клиент упоминает вложение или скриншот в тексте обращения, "
-            "но файл вложения не был прикреплён."
-        )
-    return None
-
-
-# ---------------------------------------------------------------------------
-# Main ticket analysis
-# ---------------------------------------------------------------------------
-
+
+
+def _resolve_attachment_path(attachment_filename: str, data_dir: str) -> str | None:
+    raw_name = attachment_filename.strip()
+    if not raw_name:
+        return None
+    normalized = os.path.normpath(raw_name).replace("\\", "/")
+    basename = os.path.basename(normalized)
+    images_dir = os.path.join(data_dir, ATTACHMENTS_SUBDIR)
+    candidates: list[str] = []
+
+    def add(path: str):
+        if path not in candidates:
+            candidates.append(path)
+
+    parts = normalized.split("/")
+    if not os.path.isabs(normalized) and ".." not in parts:
+        add(os.path.join(data_dir, normalized))
+    add(os.path.join(images_dir, basename))
+    add(os.path.join(data_dir, basename))
+
+    name_root, ext = os.path.splitext(basename)
+    if basename and not ext:
+        add(os.path.join(images_dir, f"{name_root}{DEFAULT_IMAGE_EXT}"))
+        add(os.path.join(data_dir, f"{name_root}{DEFAULT_IMAGE_EXT}"))
+
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def get_attachment_context(
+    attachment_filename: str | None,
+    description: str | None,
+    data_dir: str,
+) -> str | None:
+    if attachment_filename:
+        image_path = _resolve_attachment_path(attachment_filename, data_dir)
+        if image_path:
+            description_text = analyze_image(image_path)
+            rel_path = os.path.relpath(image_path, data_dir).replace("\\", "/")
+            return f"Вложение '{rel_path}': {description_text}"
+        return (
+            f"⚠️ Указан файл вложения '{attachment_filename}', "
+            f"но файл не найден в 'data/{ATTACHMENTS_SUBDIR}/' (или legacy пути data/)."
+        )
+    if references_attachment(description):
+        return (
+            "⚠️ Клиент упоминает вложение или скриншот в тексте обращения, "
+            "но файл вложения не был прикреплён."
+        )
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Main ticket analysis
+# ---------------------------------------------------------------------------
+
 def analyze_ticket(
     description: str,
     segment: str,
@@ -571,7 +627,7 @@ def analyze_ticket(
         return {
             "ticket_type": "Консультация",
             "sentiment": "Нейтральный",
-            "priority": _compute_priority("Консультация", "Нейтральный", segment or "Mass", "", None),
+            "priority": _compute_priority("Консультация", "Нейтральный", segment or "Mass", ""),
             "language": "RU",
             "summary": "Обращение без текстового описания и вложения.",
             "recommendation": "Связаться с клиентом для уточнения запроса.",
@@ -612,43 +668,40 @@ Description:
 {attachment_section}
 Output exactly:
 {{"ticket_type": "...", "sentiment": "...", "priority": <int or null>, "language": "...", "summary": "...", "recommendation": "..."}}"""
-
-    try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            max_tokens=TICKET_MAX_TOKENS,
-            # json_object mode tells Ollama/Qwen to guarantee valid JSON output.
-            # (json_schema is an OpenAI-only extension not supported by Ollama.)
-            response_format={"type": "json_object"},
-            temperature=0.1,  # near-deterministic for classification
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_message},
-            ],
-        )
-
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError(
-                f"Empty response from local LLM — finish_reason={response.choices[0].finish_reason!r}"
-            )
-
-        result = json.loads(content)
-        result["language"] = _normalize_language(result.get("language", ""))
-        result["analysis_engine"] = f"local:{MODEL}"
-
+
+    try:
+        response = client.chat.completions.create(
+            model=MODEL,
+            max_tokens=TICKET_MAX_TOKENS,
+            # json_object mode tells Ollama/Qwen to guarantee valid JSON output.
+            # (json_schema is an OpenAI-only extension not supported by Ollama.)
+            response_format={"type": "json_object"},
+            temperature=0.1,  # near-deterministic for classification
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_message},
+            ],
+        )
+
+        content = response.choices[0].message.content
+        if not content:
+            raise ValueError(
+                f"Empty response from local LLM — finish_reason={response.choices[0].finish_reason!r}"
+            )
+
+        result = json.loads(content)
+        result["language"] = _normalize_language(result.get("language", ""))
+        result["analysis_engine"] = f"local:{MODEL}"
+
     except Exception as err:
         print(f"[LLM_LOCAL] Error: {err}. Returning deterministic fallback.")
-        fallback_type = "Консультация"
-        heuristic_fallback = _try_fast_rule_based_classification(
-            description=description or "",
-            segment=segment or "Mass",
-            attachment_context=attachment_context,
-        )
-        if heuristic_fallback is not None:
-            fallback_type = heuristic_fallback.get("ticket_type", fallback_type)
-        fallback_type = _apply_consultation_guardrail(fallback_type, description or "", attachment_context)
-        fallback_sentiment = _infer_sentiment((description or "").lower(), fallback_type)
+        # The heuristic sweep already ran (and returned None) before the LLM call,
+        # so re-running it here could only return None again — skip straight to
+        # the guardrail-based fallback type.
+        desc_lower = (description or "").lower()
+        text_lower = f"{desc_lower} {attachment_context.lower()}" if attachment_context else desc_lower
+        fallback_type = _apply_consultation_guardrail("Консультация", text_lower)
+        fallback_sentiment = _infer_sentiment(desc_lower, fallback_type)
         if fallback_type == "Спам":
             fallback_sentiment = "Нейтральный"
         result = {
@@ -658,8 +711,7 @@ Output exactly:
                 fallback_type,
                 fallback_sentiment,
                 segment or "Mass",
-                description or "",
-                attachment_context,
+                text_lower,
             ),
             "language": _infer_language(description or ""),
             "summary": "Ошибка локального LLM анализа. Требуется ручная проверка обращения.",
@@ -674,26 +726,23 @@ Output exactly:
         return result
 
     # Validate required fields
-    valid_types = set(TICKET_TYPES)
-    valid_sentiments = {"Позитивный", "Нейтральный", "Негативный"}
-
-    if result.get("ticket_type") not in valid_types:
+    desc_lower = (description or "").lower()
+    text_lower = f"{desc_lower} {attachment_context.lower()}" if attachment_context else desc_lower
+    if result.get("ticket_type") not in VALID_TICKET_TYPES:
         result["ticket_type"] = "Консультация"
     result["ticket_type"] = _apply_consultation_guardrail(
         result.get("ticket_type", "Консультация"),
-        description or "",
-        attachment_context,
+        text_lower,
     )
-    if result.get("sentiment") not in valid_sentiments:
-        result["sentiment"] = _infer_sentiment((description or "").lower(), result.get("ticket_type", "Консультация"))
+    if result.get("sentiment") not in VALID_SENTIMENTS:
+        result["sentiment"] = _infer_sentiment(desc_lower, result.get("ticket_type", "Консультация"))
     if result.get("ticket_type") == "Спам":
         result["sentiment"] = "Нейтральный"
     result["priority"] = _compute_priority(
         result.get("ticket_type", "Консультация"),
         result.get("sentiment", "Нейтральный"),
         segment or "Mass",
-        description or "",
-        attachment_context,
+        text_lower,
     )
     _ensure_summary_and_recommendation(
         result,
@@ -702,67 +751,114 @@ Output exactly:
     )
     result.setdefault("analysis_engine", f"local:{MODEL}")
     return result
-
-
-# ---------------------------------------------------------------------------
-# Assistant query (NL → SQL → chart)
-# ---------------------------------------------------------------------------
-
-def run_assistant_query(query: str, db_context: str) -> dict:
-    """Run a natural language query and return chart instructions."""
-    system = """You are a data analyst for the FIRE ticket routing system.
-You have a PostgreSQL database with these tables:
-- tickets (id, guid, gender, birth_date, description, attachment, segment, country, region, city, street, house)
-- ticket_analysis (id, ticket_id, ticket_type, sentiment, priority_score, language, summary, recommendation, attachment_description, client_lat, client_lon, nearest_office, analyzed_at)
-- managers (id, full_name, position, office, skills, current_load)
-- business_units (id, office_name, address, latitude, longitude)
-- assignments (id, ticket_id, manager_id, assigned_office, round_robin_index, assigned_at)
-
-Output ONLY valid JSON (no markdown, no explanation):
-{"answer": "brief explanation in Russian", "sql": "SELECT label, value FROM ...", "chart_type": "bar|pie|line|table", "chart_title": "Title in Russian"}
-
-The SQL must return exactly 2 columns named label (text) and value (number)."""
-
-    try:
-        response = client.chat.completions.create(
-            model=ASSISTANT_MODEL,
-            max_tokens=ASSISTANT_MAX_TOKENS,
-            response_format={"type": "json_object"},
-            temperature=0.1,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": f"Query: {query}\n\nData summary:\n{db_context}"},
-            ],
-        )
-        content = response.choices[0].message.content or ""
-        return json.loads(content)
-    except json.JSONDecodeError as e:
-        content = response.choices[0].message.content if "response" in dir() else ""
-        return {
-            "answer": content or f"JSON parse error: {e}",
-            "sql": None,
-            "chart_type": "table",
-            "chart_title": "Результат запроса",
-        }
-    except Exception as e:
-        return {
-            "answer": f"Ошибка локального LLM: {e}",
-            "sql": None,
-            "chart_type": "table",
-            "chart_title": "Ошибка",
-        }
-
-
-# ---------------------------------------------------------------------------
-# Quick smoke test
-# ---------------------------------------------------------------------------
-if __name__ == "__main__":
-    print(f"[llm_local] Model: {MODEL}  Base URL: {LOCAL_BASE_URL}")
-    test_ticket = {
-        "description": "Не могу войти в приложение, пишет ошибка авторизации. Срочно!",
-        "segment": "Mass",
-        "country": "Kazakhstan",
-    }
-    print("[llm_local] Test ticket:", test_ticket)
-    result = analyze_ticket(**test_ticket)
-    print("[llm_local] Result:", json.dumps(result, ensure_ascii=False, indent=2))
+
+
+# Identical to llm.py — local Ollama serves fewer parallel requests well,
+# hence the smaller default.
+BATCH_MAX_WORKERS = int(os.getenv("LOCAL_LLM_BATCH_MAX_WORKERS", "4"))
+
+
+def analyze_tickets_batch(items: list[dict]) -> list[dict]:
+    """
+    Analyze a micro-batch of tickets in one dispatch (identical to llm.py).
+
+    Fans the batch out over a thread pool, submitting the longest descriptions
+    first; results come back in input order and each item has its own fallback.
+    """
+    results: list[dict | None] = [None] * len(items)
+    order = sorted(
+        range(len(items)),
+        key=lambda i: len(items[i].get("description") or ""),
+        reverse=True,
+    )
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, max(1, len(items)))) as executor:
+        futures = {
+            executor.submit(
+                analyze_ticket,
+                description=items[i].get("description") or "",
+                segment=items[i].get("segment") or "Mass",
+                country=items[i].get("country") or "",
+                attachment_context=items[i].get("attachment_context"),
+            ): i
+            for i in order
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as err:
+                print(f"[LLM] Batch item error: {err}. Returning deterministic fallback.")
+                results[i] = {
+                    "ticket_type": "Консультация",
+                    "sentiment": "Нейтральный",
+                    "priority": 5,
+                    "language": "RU",
+                    "summary": "Ошибка LLM анализа. Требуется ручная проверка обращения.",
+                    "recommendation": "Провести ручную классификацию и проверить доступность LLM-сервиса.",
+                    "analysis_engine": "fallback:batch_error",
+                }
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Assistant query (NL → SQL → chart)
+# ---------------------------------------------------------------------------
+
+def run_assistant_query(query: str, db_context: str) -> dict:
+    """Run a natural language query and return chart instructions."""
+    system = """You are a data analyst for the FIRE ticket routing system.
+You have a PostgreSQL database with these tables:
+- tickets (id, guid, gender, birth_date, description, attachment, segment, country, region, city, street, house)
+- ticket_analysis (id, ticket_id, ticket_type, sentiment, priority_score, language, summary, recommendation, attachment_description, client_lat, client_lon, nearest_office, analyzed_at)
+- managers (id, full_name, position, office, skills, current_load)
+- business_units (id, office_name, address, latitude, longitude)
+- assignments (id, ticket_id, manager_id, assigned_office, round_robin_index, assigned_at)
+
+Output ONLY valid JSON (no markdown, no explanation):
+{"answer": "brief explanation in Russian", "sql": "SELECT label, value FROM ...", "chart_type": "bar|pie|line|table", "chart_title": "Title in Russian"}
+
+The SQL must return exactly 2 columns named label (text) and value (number)."""
+
+    try:
+        response = client.chat.completions.create(
+            model=ASSISTANT_MODEL,
+            max_tokens=ASSISTANT_MAX_TOKENS,
+            response_format={"type": "json_object"},
+            temperature=0.1,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": f"Query: {query}\n\nData summary:\n{db_context}"},
+            ],
+        )
+        content = response.choices[0].message.content or ""
+        return json.loads(content)
+    except json.JSONDecodeError as e:
+        content = response.choices[0].message.content if "response" in dir() else ""
+        return {
+            "answer": content or f"JSON parse error: {e}",
+            "sql": None,
+            "chart_type": "table",
+            "chart_title": "Результат запроса",
+        }
+    except Exception as e:
+        return {
+            "answer": f"Ошибка локального LLM: {e}",
+            "sql": None,
+            "chart_type": "table",
+            "chart_title": "Ошибка",
+        }
+
+
+# ---------------------------------------------------------------------------
+# Quick smoke test
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    print(f"[llm_local] Model: {MODEL}  Base URL: {LOCAL_BASE_URL}")
+    test_ticket = {
+        "description": "Не могу войти в приложение, пишет ошибка авторизации. Срочно!",
+        "segment": "Mass",
+        "country": "Kazakhstan",
+    }
+    print("[llm_local] Test ticket:", test_ticket)
+    result = analyze_ticket(**test_ticket)
+    print("[llm_local] Result:", json.dumps(result, ensure_ascii=False, indent=2))
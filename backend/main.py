@@ -1,14 +1,18 @@
 import os
 import threading
+import time
 from typing import List, Optional
-from collections import defaultdict
 
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, text
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import Float, String, cast, func, literal, select, text, union_all
 
-from database import get_db, init_db
+from database import engine, get_db, get_async_db, init_db
 from models import Ticket, TicketAnalysis, Manager, BusinessUnit, Assignment
 from schemas import (
     TicketOut,
@@ -19,9 +23,15 @@ from schemas import (
     AssistantResponse,
 )
 from llm import run_assistant_query
-from routing import filter_managers, has_explicit_foreign_location, EQUIDISTANT_THRESHOLD_KM
-
-app = FastAPI(title="FIRE — Freedom Intelligent Routing Engine", version="1.0.0")
+from pydantic import TypeAdapter
+
+# orjson serializes responses in C (datetime/UUID handled natively) — the
+# default encoder was the hot path when returning large ticket pages.
+app = FastAPI(
+    title="FIRE — Freedom Intelligent Routing Engine",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,104 +40,112 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# The tickets list and stats payloads are dict-heavy JSON that compresses
+# 10-20x; small responses are left alone.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
-# Pipeline state
-_pipeline_status = {"running": False, "progress": 0, "total": 0, "current": "", "done": False, "error": None}
+# Short-TTL response cache for endpoints the dashboard polls far more often
+# than their data changes. Per-process: with several workers each keeps its
+# own copy, and the TTL bounds staleness either way. Cleared explicitly when
+# a pipeline run finishes or the DB is reset.
+_response_cache: dict = {}
+_STATS_TTL_SEC = 10.0
+_BUSINESS_UNITS_TTL_SEC = 300.0
 
 
-def _build_cross_city_consultation_note(ticket: Ticket, managers: List[Manager]) -> Optional[str]:
-    """Build a non-blocking UI note for explicit abroad mentions in ticket text."""
-    if not ticket.description or not has_explicit_foreign_location(ticket.description):
-        return None
-    if not ticket.analysis or not ticket.assignment:
-        return None
-    if ticket.analysis.ticket_type == "Спам":
-        return None
-
-    eligible_global = filter_managers(
-        managers=managers,
-        office=None,
-        segment=ticket.segment or "Mass",
-        ticket_type=ticket.analysis.ticket_type or "Консультация",
-        language=ticket.analysis.language or "RU",
-        sentiment=ticket.analysis.sentiment or "Нейтральный",
-        limit=None,
-    )
-    assigned_office = ticket.assignment.assigned_office
-    alternative = next(
-        (m for m in eligible_global if m.office and m.office != assigned_office),
-        None,
-    )
-    if not alternative:
-        return None
-
-    return (
-        "Клиент явно указал, что находится за пределами Казахстана. "
-        "По правилу организаторов распределение сохраняется 50/50 между Астаной и Алматы. "
-        f"Для онлайн-консультации можно рассмотреть {alternative.full_name} "
-        f"({alternative.office}, текущая нагрузка {alternative.current_load})."
-    )
+def _cache_get(key: str, ttl: float):
+    entry = _response_cache.get(key)
+    if entry and (time.monotonic() - entry[0]) < ttl:
+        return entry[1]
+    return None
 
 
-def _build_skill_gap_routing_note(ticket: Ticket) -> Optional[str]:
-    """
-    Build a note when a client was routed to a non-nearest office because the
-    nearest office had no managers with the required skills (VIP, KZ, ENG, etc.).
-
-    Uses pre-computed distances stored in ticket_analysis (geo_nearest_office,
-    dist_to_nearest_km, dist_to_assigned_km) to avoid re-running Haversine at
-    query time.
-    """
-    if not ticket.analysis or not ticket.assignment:
-        return None
-    if ticket.analysis.ticket_type == "Спам":
-        return None
-
-    geo_nearest = ticket.analysis.geo_nearest_office
-    assigned_office = ticket.assignment.assigned_office
-    dist_nearest = ticket.analysis.dist_to_nearest_km
-    dist_assigned = ticket.analysis.dist_to_assigned_km
-
-    if not geo_nearest or not assigned_office:
-        return None
-    if geo_nearest == assigned_office:
-        return None  # no fallback — normal routing
-    if dist_nearest is None or dist_assigned is None:
-        return None
-    if dist_assigned - dist_nearest <= EQUIDISTANT_THRESHOLD_KM:
-        return None  # within tie-break threshold — not a skill-gap fallback
-
-    # Infer reason from the ticket's constraints
-    segment = ticket.segment or "Mass"
-    ticket_type = ticket.analysis.ticket_type or "Консультация"
-    language = ticket.analysis.language or "RU"
-
-    if segment in ("VIP", "Priority"):
-        reason = f"в офисе {geo_nearest} нет менеджеров с навыком VIP"
-    elif ticket_type == "Смена данных":
-        reason = f"в офисе {geo_nearest} нет Главного специалиста"
-    elif language == "KZ":
-        reason = f"в офисе {geo_nearest} нет менеджеров с навыком KZ"
-    elif language == "ENG":
-        reason = f"в офисе {geo_nearest} нет менеджеров с навыком ENG"
-    else:
-        reason = f"в офисе {geo_nearest} нет подходящих менеджеров"
-
-    return (
-        f"Клиент направлен в {assigned_office} ({dist_assigned:.0f} км), "
-        f"хотя ближайший офис — {geo_nearest} ({dist_nearest:.0f} км). "
-        f"Причина: {reason}. "
-        f"Рекомендуется рассмотреть назначение менеджера из офиса {geo_nearest} в стандартном режиме."
-    )
+def _cache_put(key: str, value):
+    _response_cache[key] = (time.monotonic(), value)
+
+
+def _invalidate_response_cache():
+    _response_cache.clear()
 
 
-def _serialize_ticket(ticket: Ticket, managers: List[Manager]) -> TicketOut:
+# Pipeline state — the in-memory dict is a same-process fallback; the source of
+# truth is the single pipeline_state row, so a status poll hitting a different
+# uvicorn worker than the one running the pipeline still sees live progress.
+_pipeline_status = {"running": False, "progress": 0, "total": 0, "current": "", "done": False, "error": None}
+_pipeline_start_lock = threading.Lock()
+# A run that stops publishing for this long is considered dead (worker killed
+# or reloaded mid-run): claims and status reads treat such a row as not
+# running, so the shared flag self-heals the way the in-memory one did. The
+# pipeline heartbeats at least once per LLM batch and per routed ticket, so a
+# live run never comes close to this threshold.
+_PIPELINE_STALE_SECONDS = 600
+
+
+def _publish_pipeline_status(**updates):
+    """Update the in-memory status and write it through to pipeline_state."""
+    _pipeline_status.update(updates)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO pipeline_state (id, running, progress, total, current_guid, done, error) "
+                "VALUES (1, :running, :progress, :total, :current, :done, :error) "
+                "ON CONFLICT (id) DO UPDATE SET running = EXCLUDED.running, "
+                "progress = EXCLUDED.progress, total = EXCLUDED.total, "
+                "current_guid = EXCLUDED.current_guid, done = EXCLUDED.done, "
+                "error = EXCLUDED.error, updated_at = now()"
+            ),
+            _pipeline_status,
+        )
+
+
+def _try_claim_pipeline() -> bool:
+    """Atomically flip the shared running flag (the SET NX EX of this schema):
+    only one worker process can claim a pipeline run, and a row whose
+    updated_at heartbeat went stale counts as expired and is claimable."""
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(
+                "INSERT INTO pipeline_state (id, running, progress, total, current_guid, done, error) "
+                "VALUES (1, TRUE, 0, 0, '', FALSE, NULL) "
+                "ON CONFLICT (id) DO UPDATE SET running = TRUE, progress = 0, total = 0, "
+                "current_guid = '', done = FALSE, error = NULL, updated_at = now() "
+                "WHERE pipeline_state.running = FALSE "
+                "OR pipeline_state.updated_at < now() - make_interval(secs => :stale) "
+                "RETURNING id"
+            ),
+            {"stale": _PIPELINE_STALE_SECONDS},
+        ).first()
+    return row is not None
+
+
+def _run_pipeline_job():
+    from pipeline import run_pipeline
+
+    def cb(i, total, guid):
+        _publish_pipeline_status(progress=i, total=total, current=guid)
+
+    try:
+        run_pipeline(progress_callback=cb)
+        _publish_pipeline_status(running=False, done=True)
+        _invalidate_response_cache()
+    except Exception as e:
+        _publish_pipeline_status(running=False, error=str(e))
+
+
+# Batch validator for ticket pages: one pydantic-core call for the whole list
+# amortizes the per-model Python overhead of TicketOut.model_validate.
+_TICKET_LIST_ADAPTER = TypeAdapter(List[TicketOut])
+
+
+def _serialize_ticket(ticket: Ticket) -> TicketOut:
+    # The cross-city and skill-gap notes are denormalized onto the assignment
+    # at pipeline time (routing.build_*_note), so serialization is column reads.
     base = TicketOut.model_validate(ticket)
-    cross_city_note = _build_cross_city_consultation_note(ticket, managers)
-    skill_gap_note = _build_skill_gap_routing_note(ticket)
+    if not ticket.assignment:
+        return base
     return base.model_copy(update={
-        "cross_city_consultation_note": cross_city_note,
-        "skill_gap_routing_note": skill_gap_note,
+        "cross_city_consultation_note": ticket.assignment.cross_city_note,
+        "skill_gap_routing_note": ticket.assignment.skill_gap_note,
     })
 
 
@@ -139,58 +157,72 @@ def on_startup():
 # ── Pipeline ──────────────────────────────────────────────────────────────────
 
 @app.post("/api/pipeline/run")
-def run_pipeline_endpoint(background_tasks: BackgroundTasks):
-    if _pipeline_status["running"]:
-        return {"message": "Pipeline already running", "status": _pipeline_status}
-
-    def _run():
-        from pipeline import run_pipeline
-        _pipeline_status.update({"running": True, "done": False, "error": None, "progress": 0})
+def run_pipeline_endpoint():
+    # A dedicated daemon thread instead of BackgroundTasks: the pipeline no
+    # longer occupies a request worker for its whole multi-minute run, and the
+    # shared-row claim makes the already-running check atomic across workers.
+    with _pipeline_start_lock:
+        if not _try_claim_pipeline():
+            return {"message": "Pipeline already running", "status": _read_pipeline_status()}
+        _pipeline_status.update(
+            {"running": True, "done": False, "error": None, "progress": 0, "total": 0, "current": ""}
+        )
+        threading.Thread(target=_run_pipeline_job, name="pipeline-worker", daemon=True).start()
+    return {"message": "Pipeline started", "status": _pipeline_status}
 
-        def cb(i, total, guid):
-            _pipeline_status["progress"] = i
-            _pipeline_status["total"] = total
-            _pipeline_status["current"] = guid
 
-        try:
-            run_pipeline(progress_callback=cb)
-            _pipeline_status["done"] = True
-        except Exception as e:
-            _pipeline_status["error"] = str(e)
-        finally:
-            _pipeline_status["running"] = False
-
-    background_tasks.add_task(_run)
-    return {"message": "Pipeline started", "status": _pipeline_status}
+def _read_pipeline_status() -> dict:
+    with engine.connect() as conn:
+        # A stale heartbeat means the worker died mid-run — report the row as
+        # not running so /run can reclaim it and /reset stops 409ing.
+        row = conn.execute(
+            text(
+                "SELECT running AND updated_at >= now() - make_interval(secs => :stale) AS running, "
+                "progress, total, current_guid, done, error "
+                "FROM pipeline_state WHERE id = 1"
+            ),
+            {"stale": _PIPELINE_STALE_SECONDS},
+        ).first()
+    if row is None:  # no pipeline has ever run on this database
+        return _pipeline_status
+    return {
+        "running": row.running,
+        "progress": row.progress,
+        "total": row.total,
+        "current": row.current_guid,
+        "done": row.done,
+        "error": row.error,
+    }
 
 
 @app.get("/api/pipeline/status")
 def pipeline_status():
-    return _pipeline_status
+    return _read_pipeline_status()
 
 
 @app.post("/api/pipeline/reset")
 def reset_pipeline(db: Session = Depends(get_db)):
     """Wipe all processed data so the pipeline can be rerun from scratch."""
-    if _pipeline_status["running"]:
+    if _read_pipeline_status()["running"]:
         raise HTTPException(status_code=409, detail="Pipeline is currently running — stop it first")
 
-    # Delete in FK-safe order
-    db.query(Assignment).delete()
-    db.query(TicketAnalysis).delete()
-    db.query(Ticket).delete()
-    db.query(Manager).delete()
-    db.query(BusinessUnit).delete()
+    # One TRUNCATE instead of five ORM deletes: Postgres drops the table pages
+    # directly (no per-row SQL) and CASCADE covers the FK order.
+    db.execute(text(
+        "TRUNCATE TABLE assignments, ticket_analysis, tickets, managers, business_units "
+        "RESTART IDENTITY CASCADE"
+    ))
     db.commit()
 
-    _pipeline_status.update({"running": False, "progress": 0, "total": 0, "current": "", "done": False, "error": None})
+    _publish_pipeline_status(running=False, progress=0, total=0, current="", done=False, error=None)
+    _invalidate_response_cache()
     return {"message": "Database reset — ready for a fresh pipeline run"}
 
 
 # ── Tickets ───────────────────────────────────────────────────────────────────
 
 @app.get("/api/tickets", response_model=List[TicketOut])
-def list_tickets(
+async def list_tickets(
     skip: int = 0,
     limit: int = 100,
     segment: Optional[str] = None,
@@ -198,59 +230,68 @@ def list_tickets(
     language: Optional[str] = None,
     office: Optional[str] = None,
     manager_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = db.query(Ticket).options(
-        joinedload(Ticket.analysis),
-        joinedload(Ticket.assignment).joinedload(Assignment.manager),
+    stmt = select(Ticket).options(
+        selectinload(Ticket.analysis),
+        selectinload(Ticket.assignment).selectinload(Assignment.manager),
     )
     if segment:
-        q = q.filter(Ticket.segment == segment)
+        stmt = stmt.where(Ticket.segment == segment)
     if ticket_type:
-        q = q.join(TicketAnalysis).filter(TicketAnalysis.ticket_type == ticket_type)
+        stmt = stmt.join(TicketAnalysis).where(TicketAnalysis.ticket_type == ticket_type)
     if language:
-        q = q.join(TicketAnalysis).filter(TicketAnalysis.language == language)
+        stmt = stmt.join(TicketAnalysis).where(TicketAnalysis.language == language)
     if office:
-        q = q.join(Assignment).filter(Assignment.assigned_office == office)
+        stmt = stmt.join(Assignment).where(Assignment.assigned_office == office)
     if manager_id:
-        q = q.join(Assignment).filter(Assignment.manager_id == manager_id)
-
-    tickets = q.offset(skip).limit(limit).all()
-    managers = db.query(Manager).all()
-    return [_serialize_ticket(ticket, managers) for ticket in tickets]
+        stmt = stmt.join(Assignment).where(Assignment.manager_id == manager_id)
+
+    # Server-side cursor: rows arrive in yield_per-sized batches and are
+    # serialized as they stream in, instead of materializing every ORM row
+    # before the first TicketOut is built. The response stays a JSON array —
+    # the dashboard consumes it as one — so only peak memory changes.
+    result = await db.stream(stmt.offset(skip).limit(limit).execution_options(yield_per=50))
+    tickets = [ticket async for ticket in result.scalars()]
+    out = _TICKET_LIST_ADAPTER.validate_python(tickets, from_attributes=True)
+    # Attach the denormalized notes in place — no per-row model_copy.
+    for dto, ticket in zip(out, tickets):
+        if ticket.assignment:
+            dto.cross_city_consultation_note = ticket.assignment.cross_city_note
+            dto.skill_gap_routing_note = ticket.assignment.skill_gap_note
+    return out
 
 
 @app.get("/api/tickets/{ticket_id}", response_model=TicketOut)
-def get_ticket(ticket_id: int, db: Session = Depends(get_db)):
-    ticket = (
-        db.query(Ticket)
+async def get_ticket(ticket_id: int, db: AsyncSession = Depends(get_async_db)):
+    stmt = (
+        select(Ticket)
         .options(
-            joinedload(Ticket.analysis),
-            joinedload(Ticket.assignment).joinedload(Assignment.manager),
+            selectinload(Ticket.analysis),
+            selectinload(Ticket.assignment).selectinload(Assignment.manager),
         )
-        .filter(Ticket.id == ticket_id)
-        .first()
+        .where(Ticket.id == ticket_id)
     )
+    ticket = (await db.execute(stmt)).scalars().first()
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
-    managers = db.query(Manager).all()
-    return _serialize_ticket(ticket, managers)
+    return _serialize_ticket(ticket)
 
 
 # ── Managers ──────────────────────────────────────────────────────────────────
 
 @app.get("/api/managers")
-def list_managers(office: Optional[str] = None, db: Session = Depends(get_db)):
-    q = db.query(Manager)
-    if office:
-        q = q.filter(Manager.office == office)
-    managers = q.order_by(Manager.office, Manager.current_load).all()
-
-    assigned_counts = dict(
-        db.query(Assignment.manager_id, func.count(Assignment.id))
-        .group_by(Assignment.manager_id)
-        .all()
+async def list_managers(office: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    # One round-trip: LEFT JOIN + GROUP BY folds the per-manager assignment
+    # counts into the manager rows instead of merging two queries in Python.
+    stmt = (
+        select(Manager, func.count(Assignment.id).label("assigned_count"))
+        .outerjoin(Assignment, Assignment.manager_id == Manager.id)
+        .group_by(Manager.id)
     )
+    if office:
+        stmt = stmt.where(Manager.office == office)
+    rows = (await db.execute(stmt.order_by(Manager.office, Manager.current_load))).all()
     return [
         {
             "id": m.id,
@@ -259,57 +300,87 @@ def list_managers(office: Optional[str] = None, db: Session = Depends(get_db)):
             "office": m.office,
             "skills": m.skills or [],
             "current_load": m.current_load,
-            "assigned_count": assigned_counts.get(m.id, 0),
-            "prior_load": m.current_load - assigned_counts.get(m.id, 0),
+            "assigned_count": assigned_count,
+            "prior_load": m.current_load - assigned_count,
         }
-        for m in managers
+        for m, assigned_count in rows
     ]
 
 
 # ── Business Units ────────────────────────────────────────────────────────────
 
 @app.get("/api/business-units", response_model=List[BusinessUnitOut])
-def list_business_units(db: Session = Depends(get_db)):
-    return db.query(BusinessUnit).all()
+async def list_business_units(db: AsyncSession = Depends(get_async_db)):
+    cached = _cache_get("business_units", _BUSINESS_UNITS_TTL_SEC)
+    if cached is not None:
+        return cached
+    units = (await db.execute(select(BusinessUnit))).scalars().all()
+    _cache_put("business_units", units)
+    return units
 
 
 # ── Stats ─────────────────────────────────────────────────────────────────────
 
-@app.get("/api/stats")
-def get_stats(db: Session = Depends(get_db)):
-    total = db.query(Ticket).count()
-
-    by_type = {
-        str(r[0] or "N/A"): r[1]
-        for r in db.query(TicketAnalysis.ticket_type, func.count()).group_by(TicketAnalysis.ticket_type).all()
-    }
-    by_sentiment = {
-        str(r[0] or "N/A"): r[1]
-        for r in db.query(TicketAnalysis.sentiment, func.count()).group_by(TicketAnalysis.sentiment).all()
-    }
-    by_language = {
-        str(r[0] or "N/A"): r[1]
-        for r in db.query(TicketAnalysis.language, func.count()).group_by(TicketAnalysis.language).all()
-    }
-    by_segment = {
-        str(r[0] or "N/A"): r[1]
-        for r in db.query(Ticket.segment, func.count()).group_by(Ticket.segment).all()
-    }
-    by_office = {
-        str(r[0] or "N/A"): r[1]
-        for r in db.query(Assignment.assigned_office, func.count()).group_by(Assignment.assigned_office).all()
-    }
+def _dim_counts(dim: str, column):
+    """One (dim, key, value) branch of the fused stats query."""
+    return select(
+        literal(dim).label("dim"),
+        cast(column, String).label("key"),
+        cast(func.count(), Float).label("value"),
+    ).group_by(column)
+
+
+# All dashboard aggregates fused into a single UNION ALL statement: one
+# round-trip instead of seven, since the endpoint is network-latency-bound.
+_STATS_QUERY = union_all(
+    _dim_counts("type", TicketAnalysis.ticket_type),
+    _dim_counts("sentiment", TicketAnalysis.sentiment),
+    _dim_counts("language", TicketAnalysis.language),
+    _dim_counts("segment", Ticket.segment),
+    _dim_counts("office", Assignment.assigned_office),
+    select(
+        literal("total").label("dim"),
+        cast(literal(None), String).label("key"),
+        cast(func.count(), Float).label("value"),
+    ).select_from(Ticket),
+    select(
+        literal("avg_priority").label("dim"),
+        cast(literal(None), String).label("key"),
+        cast(func.avg(TicketAnalysis.priority_score), Float).label("value"),
+    ),
+)
 
-    avg_priority_row = db.query(func.avg(TicketAnalysis.priority_score)).scalar()
-    avg_priority = round(float(avg_priority_row or 0), 2)
 
-    # Manager loads — split into prior (from CSV) and assigned (this pipeline run)
-    assigned_counts = dict(
-        db.query(Assignment.manager_id, func.count(Assignment.id))
-        .group_by(Assignment.manager_id)
-        .all()
+@app.get("/api/stats")
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
+    cached = _cache_get("stats", _STATS_TTL_SEC)
+    if cached is not None:
+        return cached
+
+    dims: dict = {"type": {}, "sentiment": {}, "language": {}, "segment": {}, "office": {}}
+    total = 0
+    avg_priority = 0.0
+    for dim, key, value in (await db.execute(_STATS_QUERY)).all():
+        if dim == "total":
+            total = int(value)
+        elif dim == "avg_priority":
+            avg_priority = round(float(value or 0), 2)
+        else:
+            dims[dim][str(key or "N/A")] = int(value)
+    by_type, by_sentiment, by_language, by_segment, by_office = (
+        dims["type"], dims["sentiment"], dims["language"], dims["segment"], dims["office"]
     )
-    managers = db.query(Manager).order_by(Manager.current_load.desc()).all()
+
+    # Manager loads — split into prior (from CSV) and assigned (this pipeline run),
+    # aggregated in the same LEFT JOIN round-trip as the manager rows.
+    manager_rows = (
+        await db.execute(
+            select(Manager, func.count(Assignment.id).label("assigned_count"))
+            .outerjoin(Assignment, Assignment.manager_id == Manager.id)
+            .group_by(Manager.id)
+            .order_by(Manager.current_load.desc())
+        )
+    ).all()
     manager_loads = [
         {
             "id": m.id,
@@ -318,13 +389,13 @@ def get_stats(db: Session = Depends(get_db)):
             "position": m.position,
             "skills": m.skills or [],
             "load": m.current_load,
-            "assigned_count": assigned_counts.get(m.id, 0),
-            "prior_load": m.current_load - assigned_counts.get(m.id, 0),
+            "assigned_count": assigned_count,
+            "prior_load": m.current_load - assigned_count,
         }
-        for m in managers
+        for m, assigned_count in manager_rows
     ]
 
-    return {
+    stats = {
         "total_tickets": total,
         "by_type": by_type,
         "by_sentiment": by_sentiment,
@@ -334,32 +405,53 @@ def get_stats(db: Session = Depends(get_db)):
         "avg_priority": avg_priority,
         "manager_loads": manager_loads,
     }
+    _cache_put("stats", stats)
+    return stats
 
 
 # ── AI Assistant (Star Task) ──────────────────────────────────────────────────
 
 @app.post("/api/assistant")
-def assistant_query(req: AssistantRequest, db: Session = Depends(get_db)):
+async def assistant_query(req: AssistantRequest, db: AsyncSession = Depends(get_async_db)):
     # Build a brief context summary for the LLM
-    total = db.query(Ticket).count()
+    total = (await db.execute(select(func.count()).select_from(Ticket))).scalar()
     by_type = {
         str(r[0] or "N/A"): r[1]
-        for r in db.query(TicketAnalysis.ticket_type, func.count()).group_by(TicketAnalysis.ticket_type).all()
+        for r in (
+            await db.execute(
+                select(TicketAnalysis.ticket_type, func.count()).group_by(TicketAnalysis.ticket_type)
+            )
+        ).all()
     }
     by_office = {
         str(r[0] or "N/A"): r[1]
-        for r in db.query(Assignment.assigned_office, func.count()).group_by(Assignment.assigned_office).all()
+        for r in (
+            await db.execute(
+                select(Assignment.assigned_office, func.count()).group_by(Assignment.assigned_office)
+            )
+        ).all()
     }
     db_context = f"Total tickets: {total}\nBy type: {by_type}\nBy office: {by_office}"
 
-    result = run_assistant_query(req.query, db_context)
+    # The LLM call is seconds of blocking HTTP — run it on the threadpool so
+    # the event loop keeps serving other requests in the meantime.
+    result = await run_in_threadpool(run_assistant_query, req.query, db_context)
 
     # If SQL provided, execute it safely and return rows
     chart_data = None
     if result.get("sql"):
         try:
-            rows = db.execute(text(result["sql"])).fetchall()
-            keys = db.execute(text(result["sql"])).keys()
+            # Execute once (the second .keys() execution doubled the DB cost and
+            # its result was never used) and cap row count so a runaway
+            # LLM-generated query cannot saturate the pool. The read-only
+            # transaction with a 3s statement timeout bounds what generated SQL
+            # can do: no writes, no long-held locks.
+            bounded_sql = f"SELECT * FROM ({result['sql'].rstrip().rstrip(';')}) _q LIMIT 1000"
+            await db.rollback()  # close the implicit txn from the context queries
+            async with db.begin():
+                await db.execute(text("SET TRANSACTION READ ONLY"))
+                await db.execute(text("SET LOCAL statement_timeout = '3s'"))
+                rows = (await db.execute(text(bounded_sql))).fetchall()
             chart_data = {
                 "labels": [str(r[0]) for r in rows],
                 "values": [r[1] if len(r) > 1 else 1 for r in rows],
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Date, Float, DateTime, ForeignKey, ARRAY
+from sqlalchemy import Column, Integer, String, Text, Date, Float, DateTime, Boolean, ForeignKey, ARRAY
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -14,7 +14,7 @@ class BusinessUnit(Base):
     latitude = Column(Float)
     longitude = Column(Float)
 
-    managers = relationship("Manager", back_populates="business_unit")
+    managers = relationship("Manager", back_populates="business_unit", passive_deletes=True)
 
 
 class Manager(Base):
@@ -23,12 +23,12 @@ class Manager(Base):
     id = Column(Integer, primary_key=True)
     full_name = Column(String(200), nullable=False)
     position = Column(String(100))          # Специалист | Ведущий специалист | Главный специалист
-    office = Column(String(100), ForeignKey("business_units.office_name"))
+    office = Column(String(100), ForeignKey("business_units.office_name", ondelete="CASCADE"))
     skills = Column(ARRAY(String))          # ['VIP', 'ENG', 'KZ']
     current_load = Column(Integer, default=0)
 
     business_unit = relationship("BusinessUnit", back_populates="managers")
-    assignments = relationship("Assignment", back_populates="manager")
+    assignments = relationship("Assignment", back_populates="manager", passive_deletes=True)
 
 
 class Ticket(Base):
@@ -40,26 +40,26 @@ class Ticket(Base):
     birth_date = Column(Date)
     description = Column(Text)
     attachment = Column(String(255))
-    segment = Column(String(20))            # Mass | VIP | Priority
+    segment = Column(String(20), index=True)  # Mass | VIP | Priority
     country = Column(String(100))
     region = Column(String(100))
     city = Column(String(100))
     street = Column(String(200))
     house = Column(String(20))
 
-    analysis = relationship("TicketAnalysis", back_populates="ticket", uselist=False)
-    assignment = relationship("Assignment", back_populates="ticket", uselist=False)
+    analysis = relationship("TicketAnalysis", back_populates="ticket", uselist=False, passive_deletes=True)
+    assignment = relationship("Assignment", back_populates="ticket", uselist=False, passive_deletes=True)
 
 
 class TicketAnalysis(Base):
     __tablename__ = "ticket_analysis"
 
     id = Column(Integer, primary_key=True)
-    ticket_id = Column(Integer, ForeignKey("tickets.id"), unique=True)
-    ticket_type = Column(String(100))       # Жалоба | Смена данных | ...
-    sentiment = Column(String(20))          # Позитивный | Нейтральный | Негативный
+    ticket_id = Column(Integer, ForeignKey("tickets.id", ondelete="CASCADE"), unique=True)
+    ticket_type = Column(String(100), index=True)  # Жалоба | Смена данных | ...
+    sentiment = Column(String(20), index=True)     # Позитивный | Нейтральный | Негативный
     priority_score = Column(Integer)        # 1-10
-    language = Column(String(5))            # RU | KZ | ENG
+    language = Column(String(5), index=True)       # RU | KZ | ENG
     summary = Column(Text)
     recommendation = Column(Text)
     client_lat = Column(Float)
@@ -69,19 +69,36 @@ class TicketAnalysis(Base):
     dist_to_nearest_km = Column(Float)          # km: client → geo_nearest_office
     dist_to_assigned_km = Column(Float)         # km: client → assigned office
     attachment_description = Column(Text)   # Vision analysis of the image, or missing-attachment note
+    has_foreign_mention = Column(Boolean, default=False)  # text explicitly says the client is abroad
     analyzed_at = Column(DateTime(timezone=True), server_default=func.now())
 
     ticket = relationship("Ticket", back_populates="analysis")
 
 
+class PipelineState(Base):
+    """Single-row (id=1) pipeline progress shared across worker processes."""
+    __tablename__ = "pipeline_state"
+
+    id = Column(Integer, primary_key=True)
+    running = Column(Boolean, nullable=False, default=False)
+    progress = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    current_guid = Column(String(100), nullable=False, default="")
+    done = Column(Boolean, nullable=False, default=False)
+    error = Column(Text)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 class Assignment(Base):
     __tablename__ = "assignments"
 
     id = Column(Integer, primary_key=True)
-    ticket_id = Column(Integer, ForeignKey("tickets.id"), unique=True)
-    manager_id = Column(Integer, ForeignKey("managers.id"))
-    assigned_office = Column(String(100))
+    ticket_id = Column(Integer, ForeignKey("tickets.id", ondelete="CASCADE"), unique=True)
+    manager_id = Column(Integer, ForeignKey("managers.id", ondelete="CASCADE"))
+    assigned_office = Column(String(100), index=True)
     round_robin_index = Column(Integer)
+    cross_city_note = Column(Text)          # precomputed UI note: client is abroad
+    skill_gap_note = Column(Text)           # precomputed UI note: non-nearest office fallback
     assigned_at = Column(DateTime(timezone=True), server_default=func.now())
 
     ticket = relationship("Ticket", back_populates="assignment")
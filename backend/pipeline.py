@@ -5,26 +5,113 @@ Main data processing pipeline:
 3. Apply routing rules and assign managers
 """
 
+import io
 import os
 import csv
 import uuid
 import math
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional
 from time import perf_counter
 
+import numpy as np
 import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # optional fast path; pandas parser still works without it
+    pa = None
+    pa_csv = None
+
 from sqlalchemy.orm import Session
 
 from database import SessionLocal, init_db
 from models import BusinessUnit, Manager, Ticket, TicketAnalysis, Assignment
-from llm import analyze_ticket, get_attachment_context
+from llm import analyze_tickets_batch, get_attachment_context
 from geocoding import OFFICE_COORDS, find_nearest_office, haversine
-from routing import reset_counters, route_ticket
+from routing import (
+    build_cross_city_consultation_note,
+    build_skill_gap_routing_note,
+    has_explicit_foreign_location,
+    prepare_managers,
+    register_assignment,
+    reset_counters,
+    route_ticket,
+)
+
+# Opt-out switch for the pyarrow CSV parser (multithreaded, zero-copy strings).
+FAST_IO = os.getenv("FAST_IO", "true").strip().lower() in ("1", "true", "yes")
+
+
+def _read_csv(path: str, dtype_str: bool = False) -> pd.DataFrame:
+    """
+    Parse a CSV into a DataFrame, preferring pyarrow's multithreaded reader.
+    Falls back to pandas when pyarrow is unavailable, FAST_IO is off, or the
+    file trips the stricter Arrow parser.
+    """
+    if FAST_IO and pa_csv is not None:
+        try:
+            convert_options = None
+            if dtype_str:
+                # Mirror pd.read_csv(dtype=str): every column parses as string
+                # so bare numbers don't come back as int64/float64.
+                with open(path, "r", encoding="utf-8-sig", newline="") as f:
+                    header = next(csv.reader(f))
+                convert_options = pa_csv.ConvertOptions(
+                    column_types={name: pa.string() for name in header},
+                    strings_can_be_null=True,
+                )
+            tbl = pa_csv.read_csv(
+                path,
+                read_options=pa_csv.ReadOptions(use_threads=True),
+                convert_options=convert_options,
+            )
+            df = tbl.to_pandas()
+            # Arrow nulls surface as None; normalize to NaN so the loaders'
+            # string cleaning sees the same missing sentinel as pandas.
+            return df.where(df.notna(), math.nan)
+        except Exception as e:
+            print(f"[Pipeline] pyarrow CSV read failed for {os.path.basename(path)} ({e}); using pandas.")
+    return pd.read_csv(path, dtype=str if dtype_str else None)
+
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 LABELS_CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "tickets_guid_language_label.csv")
+# The CSV sits at the repo root, but its generated parquet twin goes under
+# data/ with the other gitignored cache files instead of polluting the root.
+LABELS_PARQUET_PATH = os.path.join(
+    DATA_DIR, os.path.splitext(os.path.basename(LABELS_CSV_PATH))[0] + ".parquet"
+)
+
+
+def _read_labels_frame() -> pd.DataFrame | None:
+    """
+    Read the labels file, maintaining a Parquet twin that is refreshed
+    whenever the CSV's mtime is newer. Parquet loads column-oriented and
+    skips re-parsing the CSV on every pipeline run.
+    """
+    if not os.path.exists(LABELS_CSV_PATH):
+        print(f"[Pipeline][Accuracy] labels file not found: {LABELS_CSV_PATH}")
+        return None
+    try:
+        if pa is not None:
+            import pyarrow.parquet as pq
+            if (
+                os.path.exists(LABELS_PARQUET_PATH)
+                and os.path.getmtime(LABELS_PARQUET_PATH) >= os.path.getmtime(LABELS_CSV_PATH)
+            ):
+                return pq.read_table(LABELS_PARQUET_PATH).to_pandas()
+            tbl = pa_csv.read_csv(LABELS_CSV_PATH)
+            try:
+                pq.write_table(tbl, LABELS_PARQUET_PATH)
+            except OSError as e:
+                print(f"[Pipeline][Accuracy] could not write parquet cache: {e}")
+            return tbl.to_pandas()
+        return pd.read_csv(LABELS_CSV_PATH, dtype=str, encoding="utf-8-sig")
+    except Exception as e:
+        print(f"[Pipeline][Accuracy] failed to read labels file: {e}")
+        return None
 
 LANGUAGE_LABEL_MAP = {
     "ru": "RU",
@@ -39,18 +126,24 @@ LANGUAGE_LABEL_MAP = {
     "latin-other": "RU",
 }
 
+# Casing variants prebuilt so the accuracy merge can map label strings
+# directly, without a lowercasing pass over the whole column.
+_LANG_LOOKUP = {
+    variant: lang
+    for key, lang in LANGUAGE_LABEL_MAP.items()
+    for variant in (key, key.upper(), key.title())
+}
 
-def _percentile(values: list[float], p: float) -> float:
-    """Nearest-rank percentile for small latency samples."""
-    if not values:
+
+def _percentile(values, p: float) -> float:
+    """Nearest-rank percentile for latency samples (vectorized in NumPy)."""
+    if len(values) == 0:
         return 0.0
-    ordered = sorted(values)
-    rank = max(1, math.ceil((p / 100.0) * len(ordered)))
-    return ordered[rank - 1]
+    return float(np.percentile(np.asarray(values), p, method="nearest"))
 
 
-def _timing_summary_line(name: str, values: list[float]) -> str:
-    if not values:
+def _timing_summary_line(name: str, values) -> str:
+    if len(values) == 0:
         return f"[Pipeline][Timing] {name}: no samples"
     avg = sum(values) / len(values)
     p95 = _percentile(values, 95)
@@ -61,15 +154,6 @@ def _timing_summary_line(name: str, values: list[float]) -> str:
     )
 
 
-def _normalize_expected_language(label_value: str | None) -> str | None:
-    if label_value is None:
-        return None
-    raw = str(label_value).strip().lower()
-    if not raw or raw == "nan":
-        return None
-    return LANGUAGE_LABEL_MAP.get(raw)
-
-
 def _ensure_summary_and_recommendation_fields(result: dict) -> None:
     summary = result.get("summary")
     if not isinstance(summary, str) or not summary.strip():
@@ -90,88 +174,73 @@ def _ensure_summary_and_recommendation_fields(result: dict) -> None:
 
 def log_accuracy_from_labels(db: Session):
     """Compare predictions with tickets_guid_language_label.csv and print metrics."""
-    if not os.path.exists(LABELS_CSV_PATH):
-        print(f"[Pipeline][Accuracy] labels file not found: {LABELS_CSV_PATH}")
+    frame = _read_labels_frame()
+    if frame is None:
         return
 
-    labels: dict[str, dict[str, str]] = {}
-    try:
-        with open(LABELS_CSV_PATH, "r", encoding="utf-8-sig", newline="") as f:
-            reader = csv.DictReader(f)
-            required_cols = {"GUID клиента", "Language", "Label"}
-            if not required_cols.issubset(set(reader.fieldnames or [])):
-                print(
-                    "[Pipeline][Accuracy] labels file has unexpected columns. "
-                    "Expected: GUID клиента, Language, Label"
-                )
-                return
-
-            for row in reader:
-                guid = str(row.get("GUID клиента", "")).strip().lower()
-                if not guid or guid == "nan":
-                    continue
-                labels[guid] = {
-                    "language": str(row.get("Language", "")).strip(),
-                    "label": str(row.get("Label", "")).strip(),
-                }
-    except Exception as e:
-        print(f"[Pipeline][Accuracy] failed to read labels file: {e}")
+    required_cols = {"GUID клиента", "Language", "Label"}
+    if not required_cols.issubset(set(frame.columns)):
+        print(
+            "[Pipeline][Accuracy] labels file has unexpected columns. "
+            "Expected: GUID клиента, Language, Label"
+        )
         return
 
-    if not labels:
+    # Vectorized normalization into a labels frame, deduped like the old
+    # dict build (later rows for the same GUID win).
+    labels_df = pd.DataFrame({
+        "guid": frame["GUID клиента"].astype(str).str.strip().str.lower(),
+        "language": frame["Language"].astype(str).str.strip(),
+        "label": frame["Label"].astype(str).str.strip(),
+    })
+    labels_df = labels_df[labels_df["guid"].ne("") & labels_df["guid"].ne("nan")]
+    labels_df = labels_df.drop_duplicates("guid", keep="last")
+
+    if labels_df.empty:
         print("[Pipeline][Accuracy] labels file is empty.")
         return
 
-    predictions: dict[str, dict[str, str | None]] = {}
-    rows = (
-        db.query(Ticket.guid, TicketAnalysis.ticket_type, TicketAnalysis.language)
+    # One SQL round-trip for predictions, then a pandas merge — the metric
+    # counters become vectorized boolean-mask sums instead of a Python loop.
+    preds_df = pd.read_sql(
+        db.query(
+            Ticket.guid.label("guid"),
+            TicketAnalysis.ticket_type.label("pred_type"),
+            TicketAnalysis.language.label("pred_lang"),
+        )
         .outerjoin(TicketAnalysis, TicketAnalysis.ticket_id == Ticket.id)
-        .all()
+        .statement,
+        db.get_bind(),
     )
-    for guid, ticket_type, language in rows:
-        predictions[str(guid).strip().lower()] = {
-            "ticket_type": ticket_type,
-            "language": language,
-        }
-
-    total_labels = len(labels)
-    matched = 0
-    missing_in_db = 0
-    missing_analysis = 0
-    type_correct = 0
-    lang_eval = 0
-    lang_correct = 0
-    lang_unmapped = 0
-    per_type_total: dict[str, int] = {}
-    per_type_correct: dict[str, int] = {}
-
-    for guid, ref in labels.items():
-        pred = predictions.get(guid)
-        if pred is None:
-            missing_in_db += 1
-            continue
-
-        pred_type = pred.get("ticket_type")
-        pred_lang = pred.get("language")
-        if not pred_type:
-            missing_analysis += 1
-            continue
-
-        matched += 1
-        expected_type = ref["label"]
-        per_type_total[expected_type] = per_type_total.get(expected_type, 0) + 1
-        if pred_type == expected_type:
-            type_correct += 1
-            per_type_correct[expected_type] = per_type_correct.get(expected_type, 0) + 1
-
-        expected_lang = _normalize_expected_language(ref["language"])
-        if expected_lang is None:
-            lang_unmapped += 1
-            continue
-
-        lang_eval += 1
-        if (pred_lang or "").upper() == expected_lang:
-            lang_correct += 1
+    preds_df["guid"] = preds_df["guid"].astype(str).str.strip().str.lower()
+    preds_df = preds_df.drop_duplicates("guid", keep="last")
+
+    merged = labels_df.merge(preds_df, on="guid", how="left", indicator=True)
+
+    total_labels = len(merged)
+    in_db = merged["_merge"] == "both"
+    missing_in_db = int((~in_db).sum())
+    has_type = merged["pred_type"].notna() & merged["pred_type"].ne("")
+    matched_mask = in_db & has_type
+    missing_analysis = int((in_db & ~has_type).sum())
+    matched = int(matched_mask.sum())
+
+    type_correct_mask = matched_mask & (merged["pred_type"] == merged["label"])
+    type_correct = int(type_correct_mask.sum())
+
+    expected_lang = merged["language"].map(_LANG_LOOKUP)
+    # Unusual casings miss the prebuilt variants; lowercase just those rows.
+    lookup_miss = expected_lang.isna()
+    if lookup_miss.any():
+        expected_lang[lookup_miss] = merged.loc[lookup_miss, "language"].str.lower().map(LANGUAGE_LABEL_MAP)
+    lang_eval_mask = matched_mask & expected_lang.notna()
+    lang_unmapped = int((matched_mask & expected_lang.isna()).sum())
+    lang_eval = int(lang_eval_mask.sum())
+    pred_lang_norm = merged["pred_lang"].fillna("").astype(str).str.upper()
+    lang_correct = int((lang_eval_mask & (pred_lang_norm == expected_lang)).sum())
+
+    per_type_total = merged.loc[matched_mask].groupby("label").size().to_dict()
+    per_type_correct = merged.loc[type_correct_mask].groupby("label").size().to_dict()
 
     type_acc = (type_correct / matched * 100.0) if matched else 0.0
     lang_acc = (lang_correct / lang_eval * 100.0) if lang_eval else 0.0
@@ -200,20 +269,28 @@ def log_accuracy_from_labels(db: Session):
 def load_business_units(db: Session):
     """Load business_units.csv into DB."""
     path = os.path.join(DATA_DIR, "business_units.csv")
-    df = pd.read_csv(path)
-
-    for _, row in df.iterrows():
-        office_name = str(row["Офис"]).strip()
-        if db.query(BusinessUnit).filter_by(office_name=office_name).first():
+    df = _read_csv(path)
+
+    # One SELECT for all existing keys instead of one round-trip per row.
+    existing = {r[0] for r in db.query(BusinessUnit.office_name).all()}
+    new_rows = []
+    # Vectorized cleaning + itertuples: iterrows boxes every cell per row.
+    offices = df["Офис"].astype(str).str.strip()
+    addresses = df["Адрес"].astype(str).str.strip()
+    addresses = addresses.astype(object).where(df["Адрес"].notna(), None)
+    for office_name, address in zip(offices, addresses):
+        if office_name in existing:
             continue
+        existing.add(office_name)
         coords = OFFICE_COORDS.get(office_name, (None, None))
-        bu = BusinessUnit(
+        new_rows.append(BusinessUnit(
             office_name=office_name,
-            address=str(row["Адрес"]).strip() if pd.notna(row["Адрес"]) else None,
+            address=address,
             latitude=coords[0],
             longitude=coords[1],
-        )
-        db.add(bu)
+        ))
+    if new_rows:
+        db.bulk_save_objects(new_rows)
     db.commit()
     print(f"[Pipeline] Business units loaded.")
 
@@ -221,26 +298,34 @@ def load_business_units(db: Session):
 def load_managers(db: Session):
     """Load managers.csv into DB."""
     path = os.path.join(DATA_DIR, "managers.csv")
-    df = pd.read_csv(path)
+    df = _read_csv(path)
     # Strip column names of whitespace
     df.columns = [c.strip() for c in df.columns]
 
-    for _, row in df.iterrows():
-        name = str(row["ФИО"]).strip()
-        if db.query(Manager).filter_by(full_name=name).first():
+    existing = {r[0] for r in db.query(Manager.full_name).all()}
+    new_rows = []
+    # Vectorized cleaning + itertuples: iterrows boxes every cell per row.
+    cols = ["ФИО", "Должность", "Офис", "Навыки", "Количество обращений в работе"]
+    frame = df.reindex(columns=cols)
+    for col in ("ФИО", "Должность", "Офис", "Навыки"):
+        frame[col] = frame[col].astype(str).str.strip()
+    frame[cols[4]] = pd.to_numeric(frame[cols[4]], errors="coerce").fillna(0).astype(int)
+    for name, position, office, skills_raw, load in frame.itertuples(index=False, name=None):
+        if name in existing:
             continue
+        existing.add(name)
 
-        skills_raw = str(row.get("Навыки", "")).strip()
         skills = [s.strip() for s in skills_raw.split(",") if s.strip()] if skills_raw and skills_raw != "nan" else []
 
-        manager = Manager(
+        new_rows.append(Manager(
             full_name=name,
-            position=str(row.get("Должность", "")).strip(),
-            office=str(row.get("Офис", "")).strip(),
+            position=position,
+            office=office,
             skills=skills,
-            current_load=int(row.get("Количество обращений в работе", 0)),
-        )
-        db.add(manager)
+            current_load=int(load),
+        ))
+    if new_rows:
+        db.bulk_save_objects(new_rows)
     db.commit()
     print(f"[Pipeline] Managers loaded.")
 
@@ -248,61 +333,83 @@ def load_managers(db: Session):
 def load_tickets(db: Session):
     """Load tickets.csv into DB."""
     path = os.path.join(DATA_DIR, "tickets_eval.csv")
-    df = pd.read_csv(path, dtype=str)
+    df = _read_csv(path, dtype_str=True)
     df.columns = [c.strip() for c in df.columns]
 
+    existing = {r[0] for r in db.query(Ticket.guid).all()}
+    new_rows = []
     loaded = 0
-    for _, row in df.iterrows():
-        guid = str(row.get("GUID клиента", "")).strip()
-        if not guid or guid == "nan":
-            continue
-        if db.query(Ticket).filter_by(guid=guid).first():
+    # Vectorized cleaning replaces the per-cell _clean calls: strip every
+    # string column once and map ""/"nan" to None, then iterate plain tuples.
+    cols = [
+        "GUID клиента", "Дата рождения", "Пол клиента", "Описание", "Вложения",
+        "Сегмент клиента", "Страна", "Область", "Населённый пункт", "Улица", "Дом",
+    ]
+    frame = df.reindex(columns=cols)
+    for col in cols:
+        s = frame[col].astype(str).str.strip()
+        frame[col] = s.where(s.ne("") & (s.str.lower() != "nan"))
+    # astype(object) first — where() on str dtype coerces None back to NaN.
+    frame = frame.astype(object).where(frame.notna(), None)
+    for (guid, birth_raw, gender, description, attachment, segment,
+         country, region, city, street, house) in frame.itertuples(index=False, name=None):
+        if not guid or guid in existing:
             continue
+        existing.add(guid)
 
-        birth_raw = str(row.get("Дата рождения", "")).strip()
         birth_date = None
-        if birth_raw and birth_raw != "nan":
+        if birth_raw:
             try:
                 birth_date = datetime.strptime(birth_raw.split(" ")[0], "%Y-%m-%d").date()
             except ValueError:
                 pass
 
-        ticket = Ticket(
-            guid=guid,
-            gender=_clean(row.get("Пол клиента")),
-            birth_date=birth_date,
-            description=_clean(row.get("Описание")),   # stripped column name
-            attachment=_clean(row.get("Вложения")),
-            segment=_clean(row.get("Сегмент клиента")),
-            country=_clean(row.get("Страна")),
-            region=_clean(row.get("Область")),
-            city=_clean(row.get("Населённый пункт")),
-            street=_clean(row.get("Улица")),
-            house=_clean(row.get("Дом")),
-        )
-        db.add(ticket)
+        new_rows.append((
+            guid, gender, birth_date.isoformat() if birth_date else None,
+            description, attachment, segment, country, region, city, street, house,
+        ))
         loaded += 1
+    if new_rows:
+        # COPY streams all rows in one protocol message — no per-row INSERT
+        # round-trips or ORM attribute conversion. NULL '' matches the
+        # cleaning above, which already maps empty cells to None.
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in new_rows:
+            writer.writerow(["" if v is None else v for v in row])
+        buf.seek(0)
+        cur = db.connection().connection.cursor()
+        cur.copy_expert(
+            "COPY tickets (guid, gender, birth_date, description, attachment, "
+            "segment, country, region, city, street, house) "
+            "FROM STDIN WITH (FORMAT CSV, NULL '')",
+            buf,
+        )
     db.commit()
     print(f"[Pipeline] Tickets loaded: {loaded}")
 
 
-def _clean(val) -> Optional[str]:
-    if val is None:
-        return None
-    s = str(val).strip()
-    return s if s and s.lower() != "nan" else None
+# Tickets analyzed per batch dispatch. analyze_tickets_batch fans each batch
+# out over its own worker pool; 16 keeps a dispatch well inside typical
+# per-minute rate limits while amortizing the connection overhead.
+BATCH_SIZE = 16
+
+# Concurrent attachment-context lookups (vision calls / file checks) per batch.
+MAX_PARALLEL_ATTACHMENTS = 5
 
+# Phase 2 commits once per this many tickets instead of once per ticket —
+# each commit costs a round-trip plus an fsync on the server.
+COMMIT_BATCH = 32
 
-# Number of concurrent OpenAI API calls during the LLM phase.
-# Increase if your API tier allows higher concurrency; decrease if you hit rate limits.
-MAX_PARALLEL_LLM = 5
+# Per-stage timing instrumentation. Disable to strip the perf_counter calls
+# and sample writes from the hot per-ticket loop.
+TIMING_ENABLED = os.getenv("PIPELINE_TIMING", "true").strip().lower() in ("1", "true", "yes")
 
 
-def _llm_phase(ticket: Ticket, data_dir: str) -> dict:
+def _attachment_phase(ticket: Ticket, data_dir: str) -> dict:
     """
-    Run attachment context + LLM analysis for a single ticket.
+    Resolve attachment context for a single ticket.
     Pure I/O — no shared state, safe to call from multiple threads simultaneously.
-    Returns a dict with attachment_ctx, result, attachment_time, llm_time.
     """
     t0 = perf_counter()
     attachment_ctx = get_attachment_context(
@@ -310,34 +417,9 @@ def _llm_phase(ticket: Ticket, data_dir: str) -> dict:
         description=ticket.description,
         data_dir=data_dir,
     )
-    attachment_time = perf_counter() - t0
-
-    t0 = perf_counter()
-    try:
-        result = analyze_ticket(
-            description=ticket.description or "",
-            segment=ticket.segment or "Mass",
-            country=ticket.country or "",
-            attachment_context=attachment_ctx,
-        )
-    except Exception as e:
-        print(f"[Pipeline] LLM error for {ticket.guid}: {e}")
-        result = {
-            "ticket_type": "Консультация",
-            "sentiment": "Нейтральный",
-            "priority": 5,
-            "language": "RU",
-            "summary": "Ошибка анализа ИИ.",
-            "recommendation": "Требуется ручная обработка.",
-            "analysis_engine": "fallback:pipeline_exception",
-        }
-    llm_time = perf_counter() - t0
-
     return {
         "attachment_ctx": attachment_ctx,
-        "result": result,
-        "attachment_time": attachment_time,
-        "llm_time": llm_time,
+        "attachment_time": perf_counter() - t0,
     }
 
 
@@ -358,63 +440,88 @@ def run_pipeline(progress_callback=None):
         tickets = db.query(Ticket).all()
         managers = db.query(Manager).all()
 
-        # Reset routing counters for fresh run
+        # Reset routing counters and register the manager pool for fresh run
         reset_counters()
+        prepare_managers(managers)
 
+        # One query for the analyzed ids — touching ticket.analysis lazy-loads
+        # a SELECT per ticket.
+        analyzed_ids = {tid for (tid,) in db.query(TicketAnalysis.ticket_id).all()}
         pending_tickets: list[Ticket] = []
         for ticket in tickets:
-            if ticket.analysis:
+            if ticket.id in analyzed_ids:
                 print(f"[Pipeline] Ticket {ticket.guid} already analyzed, skipping.")
                 continue
             pending_tickets.append(ticket)
 
         total = len(pending_tickets)
-        timing_samples: dict[str, list[float]] = {
-            "attachment": [],
-            "llm": [],
-            "routing": [],
-            "persist": [],
-            "ticket_total": [],
+        # Preallocated sample arrays — recording a stage is one indexed store
+        # instead of a list-append method call per ticket.
+        timing_samples: dict[str, np.ndarray] = {
+            k: np.zeros(total)
+            for k in ("attachment", "llm", "routing", "persist", "ticket_total")
         }
         analysis_engine_counts: dict[str, int] = {}
 
-        # ── Phase 1: Parallel LLM analysis ──────────────────────────────────
-        # Attachment context and LLM calls are pure network I/O with no shared
-        # mutable state, so they can safely run concurrently.
+        # ── Phase 1: Batched LLM analysis ───────────────────────────────────
+        # Tickets are analyzed in micro-batches: attachment contexts for a
+        # batch resolve concurrently, then one analyze_tickets_batch dispatch
+        # classifies the whole batch (the batch itself fans out internally).
+        # Attachment lookups for batch N+1 are prefetched while batch N's LLM
+        # dispatch runs, so the two network-bound stages overlap instead of
+        # serializing.
         # Routing and DB writes stay sequential (Phase 2) to protect round-robin
         # counters, manager load increments, and the 2GIS rate limiter.
-        print(f"[Pipeline] Phase 1 — parallel LLM analysis ({MAX_PARALLEL_LLM} workers, {total} tickets)...")
+        batches = [pending_tickets[i:i + BATCH_SIZE] for i in range(0, total, BATCH_SIZE)]
+        n_batches = len(batches)
+        print(f"[Pipeline] Phase 1 — batched LLM analysis ({n_batches} batches of up to {BATCH_SIZE}, {total} tickets)...")
         llm_phase_start = perf_counter()
         llm_outputs: dict[int, dict] = {}
 
-        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_LLM) as executor:
-            futures = {
-                executor.submit(_llm_phase, ticket, DATA_DIR): ticket
-                for ticket in pending_tickets
-            }
-            completed = 0
-            for future in as_completed(futures):
-                ticket = futures[future]
-                completed += 1
-                try:
-                    llm_outputs[ticket.id] = future.result()
-                except Exception as exc:
-                    print(f"[Pipeline] Unexpected executor error for {ticket.guid}: {exc}")
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_ATTACHMENTS) as executor:
+            def _submit_attachments(tickets_chunk: list[Ticket]) -> list:
+                return [executor.submit(_attachment_phase, t, DATA_DIR) for t in tickets_chunk]
+
+            pending_futures = _submit_attachments(batches[0]) if batches else []
+            for batch_index, batch in enumerate(batches):
+                batch_no = batch_index + 1
+                # Heartbeat once per batch: Phase 1 can run for minutes before
+                # the first routed ticket, and the shared pipeline_state row
+                # is treated as dead if updated_at stops moving.
+                if progress_callback:
+                    progress_callback(0, total, batch[0].guid)
+                attachment_outs = [f.result() for f in pending_futures]
+                # Prefetch the next batch's attachment contexts now — they
+                # resolve in the background while this batch's LLM call runs.
+                if batch_index + 1 < n_batches:
+                    pending_futures = _submit_attachments(batches[batch_index + 1])
+
+                items = [
+                    {
+                        "description": ticket.description,
+                        "segment": ticket.segment,
+                        "country": ticket.country,
+                        "attachment_context": out["attachment_ctx"],
+                    }
+                    for ticket, out in zip(batch, attachment_outs)
+                ]
+                t0 = perf_counter()
+                results = analyze_tickets_batch(items)
+                # Per-ticket LLM time is the batch wall time amortized over
+                # its tickets — individual call timing is hidden by the fan-out.
+                llm_time = (perf_counter() - t0) / len(batch)
+
+                for ticket, out, result in zip(batch, attachment_outs, results):
                     llm_outputs[ticket.id] = {
-                        "attachment_ctx": None,
-                        "result": {
-                            "ticket_type": "Консультация",
-                            "sentiment": "Нейтральный",
-                            "priority": 5,
-                            "language": "RU",
-                            "summary": "Ошибка анализа ИИ.",
-                            "recommendation": "Требуется ручная обработка.",
-                            "analysis_engine": "fallback:executor_exception",
-                        },
-                        "attachment_time": 0.0,
-                        "llm_time": 0.0,
+                        "attachment_ctx": out["attachment_ctx"],
+                        "result": result,
+                        "attachment_time": out["attachment_time"],
+                        "llm_time": llm_time,
                     }
-                print(f"[Pipeline] LLM {completed}/{total}: {ticket.guid[:8]} done")
+                print(
+                    f"[Pipeline] LLM batch {batch_no}/{n_batches} done "
+                    f"({batch_index * BATCH_SIZE + len(batch)}/{total} tickets)"
+                )
 
         print(f"[Pipeline] Phase 1 complete in {perf_counter() - llm_phase_start:.1f}s")
 
@@ -422,6 +529,9 @@ def run_pipeline(progress_callback=None):
         # Uses pre-computed LLM results; processes tickets in original DB order
         # so round-robin assignments remain deterministic.
         print(f"[Pipeline] Phase 2 — routing + persist ({total} tickets)...")
+        # Per-ticket log lines buffer here and flush once per commit batch —
+        # one stdout syscall per batch instead of several per ticket.
+        log_lines: list[str] = []
         for i, ticket in enumerate(pending_tickets):
             if progress_callback:
                 progress_callback(i, total, ticket.guid)
@@ -432,12 +542,13 @@ def run_pipeline(progress_callback=None):
             attachment_time = out["attachment_time"]
             llm_time = out["llm_time"]
 
-            timing_samples["attachment"].append(attachment_time)
-            timing_samples["llm"].append(llm_time)
+            if TIMING_ENABLED:
+                timing_samples["attachment"][i] = attachment_time
+                timing_samples["llm"][i] = llm_time
             if attachment_ctx:
-                print(f"[Pipeline]   Attachment ({ticket.guid[:8]}): {attachment_ctx[:80]}...")
+                log_lines.append(f"[Pipeline]   Attachment ({ticket.guid[:8]}): {attachment_ctx[:80]}...")
 
-            ticket_started_at = perf_counter()
+            ticket_started_at = perf_counter() if TIMING_ENABLED else 0.0
             analysis_engine = result.get("analysis_engine", "llm:unknown")
             analysis_engine_counts[analysis_engine] = analysis_engine_counts.get(analysis_engine, 0) + 1
             _ensure_summary_and_recommendation_fields(result)
@@ -451,7 +562,7 @@ def run_pipeline(progress_callback=None):
                 manager, office, lat, lon, rr_index = (None, None, None, None, None)
             else:
                 # 2. Routing
-                stage_started_at = perf_counter()
+                stage_started_at = perf_counter() if TIMING_ENABLED else 0.0
                 manager, office, lat, lon, rr_index = route_ticket(
                     managers=managers,
                     country=ticket.country,
@@ -464,9 +575,10 @@ def run_pipeline(progress_callback=None):
                     language=result.get("language", "RU"),
                     sentiment=result.get("sentiment", "Нейтральный"),
                 )
-                routing_time = perf_counter() - stage_started_at
+                routing_time = (perf_counter() - stage_started_at) if TIMING_ENABLED else 0.0
 
-            timing_samples["routing"].append(routing_time)
+            if TIMING_ENABLED:
+                timing_samples["routing"][i] = routing_time
 
             # 3. Persist analysis
             # Pre-compute distances so the API can serve them without re-running Haversine.
@@ -483,7 +595,10 @@ def run_pipeline(progress_callback=None):
                     if assigned_coords:
                         dist_to_assigned = haversine(lat, lon, assigned_coords[0], assigned_coords[1])
 
-            stage_started_at = perf_counter()
+            stage_started_at = perf_counter() if TIMING_ENABLED else 0.0
+            # Computed once here so list_tickets doesn't re-scan the free
+            # text on every page view.
+            foreign_mention = bool(ticket.description) and has_explicit_foreign_location(ticket.description)
             analysis = TicketAnalysis(
                 ticket_id=ticket.id,
                 ticket_type=result.get("ticket_type"),
@@ -499,43 +614,76 @@ def run_pipeline(progress_callback=None):
                 dist_to_nearest_km=dist_to_nearest,
                 dist_to_assigned_km=dist_to_assigned,
                 attachment_description=attachment_ctx,
+                has_foreign_mention=foreign_mention,
             )
             db.add(analysis)
 
-            # 4. Persist assignment + increment manager load
+            # 4. Persist assignment + increment manager load.
+            # The UI notes are denormalized here: their inputs (analysis,
+            # assignment, distances) are frozen after this point, so the API
+            # serves stored strings instead of recomputing per request.
             if manager:
                 assignment = Assignment(
                     ticket_id=ticket.id,
                     manager_id=manager.id,
                     assigned_office=office,
                     round_robin_index=rr_index,
+                    cross_city_note=build_cross_city_consultation_note(
+                        managers=managers,
+                        has_foreign_mention=foreign_mention,
+                        segment=ticket.segment or "Mass",
+                        ticket_type=result.get("ticket_type", "Консультация"),
+                        language=result.get("language", "RU"),
+                        sentiment=result.get("sentiment", "Нейтральный"),
+                        assigned_office=office,
+                    ),
+                    skill_gap_note=build_skill_gap_routing_note(
+                        segment=ticket.segment or "Mass",
+                        ticket_type=result.get("ticket_type", "Консультация"),
+                        language=result.get("language", "RU"),
+                        geo_nearest=geo_nearest,
+                        assigned_office=office,
+                        dist_nearest=dist_to_nearest,
+                        dist_assigned=dist_to_assigned,
+                    ),
                 )
                 db.add(assignment)
-                manager.current_load += 1
-
-            db.commit()
-            persist_time = perf_counter() - stage_started_at
-
-            total_ticket_time = perf_counter() - ticket_started_at
-            timing_samples["ticket_total"].append(total_ticket_time)
-
-            print(
-                f"[Pipeline][Timing] ticket={ticket.guid[:8]} "
-                f"attachment={attachment_time:.3f}s "
-                f"llm={llm_time:.3f}s "
-                f"routing={routing_time:.3f}s "
-                f"persist={persist_time:.3f}s "
-                f"engine={analysis_engine}"
-            )
+                register_assignment(manager)
+
+            if (i + 1) % COMMIT_BATCH == 0:
+                db.commit()
+
+            if TIMING_ENABLED:
+                persist_time = perf_counter() - stage_started_at
+                timing_samples["persist"][i] = persist_time
+                timing_samples["ticket_total"][i] = perf_counter() - ticket_started_at
+                log_lines.append(
+                    f"[Pipeline][Timing] ticket={ticket.guid[:8]} "
+                    f"attachment={attachment_time:.3f}s "
+                    f"llm={llm_time:.3f}s "
+                    f"routing={routing_time:.3f}s "
+                    f"persist={persist_time:.3f}s "
+                    f"engine={analysis_engine}"
+                )
             if is_spam:
-                print(f"[Pipeline]   Spam policy: no manager assignment, priority=None.")
-            print(f"[Pipeline] → {result.get('ticket_type')} | {result.get('language')} | office={office} | manager={manager.full_name if manager else 'NONE'}")
-
-        print(_timing_summary_line("attachment", timing_samples["attachment"]))
-        print(_timing_summary_line("llm", timing_samples["llm"]))
-        print(_timing_summary_line("routing", timing_samples["routing"]))
-        print(_timing_summary_line("persist", timing_samples["persist"]))
-        print(_timing_summary_line("ticket_total", timing_samples["ticket_total"]))
+                log_lines.append(f"[Pipeline]   Spam policy: no manager assignment, priority=None.")
+            log_lines.append(f"[Pipeline] → {result.get('ticket_type')} | {result.get('language')} | office={office} | manager={manager.full_name if manager else 'NONE'}")
+
+            if (i + 1) % COMMIT_BATCH == 0:
+                print("\n".join(log_lines))
+                log_lines.clear()
+
+        # Flush the tail of the last partial commit batch.
+        db.commit()
+        if log_lines:
+            print("\n".join(log_lines))
+
+        if TIMING_ENABLED:
+            print(_timing_summary_line("attachment", timing_samples["attachment"]))
+            print(_timing_summary_line("llm", timing_samples["llm"]))
+            print(_timing_summary_line("routing", timing_samples["routing"]))
+            print(_timing_summary_line("persist", timing_samples["persist"]))
+            print(_timing_summary_line("ticket_total", timing_samples["ticket_total"]))
         print(f"[Pipeline][Timing] analysis_engine_counts={analysis_engine_counts}")
         log_accuracy_from_labels(db)
         print("[Pipeline] Done!")
@@ -1,19 +1,95 @@
+import heapq
+import operator
 import re
+from functools import lru_cache
 from typing import List, Optional, Tuple
+
+import numpy as np
 from models import Manager
 from geocoding import (
     geocode_client, find_sorted_offices,
     fuzzy_office_city, CITY_TO_OFFICES, is_foreign,
+    KZ_CITY_COORDS, OFFICE_COORDS,
 )
 
-# Global round-robin counters
-_rr_counters: dict[str, int] = {}
+# Global round-robin counters: a flat int64 array indexed by the packed key
+# from build_rr_key. The key space is dense (office id x 32 combos), so an
+# array store replaces dict hashing per assignment; build_rr_key doubles the
+# array if office enumeration outgrows it.
+_RR_COMBOS = 32  # 2 language bits + 3 eligibility-flag bits per office
+_rr_counters: np.ndarray = np.zeros(64 * _RR_COMBOS, dtype=np.int64)
 _foreign_counter: list[int] = [0]  # mutable int for 50/50 Astana/Almaty split
+# Alternation table for the 50/50 split: index with (counter & 1) instead of
+# branching on a modulo result.
+_FOREIGN_OFFICES = ("Астана", "Алматы")
+# Offices tried, in order, when the nearest office has no eligible managers.
+_FALLBACK_OFFICES: tuple[str, ...] = ("Астана", "Алматы")
+
+# Small ints for RR key packing: offices get ids on first use (stable for the
+# process lifetime), languages beyond KZ/ENG all collapse to RU = 0.
+_rr_office_ids: dict[str, int] = {}
+_RR_LANG_IDS = {"KZ": 1, "ENG": 2}
+
+# Manager pool registered once per pipeline run (see prepare_managers).
+# The eligibility cache is keyed on a version counter, so stale top-2
+# selections are never served. Versions are tracked per office: an assignment
+# only changes loads at one office, so cached pools elsewhere stay valid.
+_prepared_managers: List[Manager] = []
+_managers_version: list[int] = [0]
+_office_versions: dict[str, int] = {}
+# Derived indexes over the prepared pool: office -> managers, and a rolling
+# office -> total load kept current by register_assignment. They turn the
+# per-call linear scans in filter_managers/_office_load into dict lookups.
+_by_office: dict[str, List[Manager]] = {}
+_office_loads: dict[str, int] = {}
+# Structure-of-Arrays view of the prepared pool: parallel office-id and
+# bitmask arrays plus an object array of the Manager instances. The hard
+# filters evaluate as one vectorized boolean mask instead of a Python loop.
+_office_ids: dict[str, int] = {}
+_soa_office: Optional[np.ndarray] = None
+_soa_mask: Optional[np.ndarray] = None
+_soa_ref: Optional[np.ndarray] = None
 
 # Distance threshold (km) within which two offices are considered "equidistant"
 # and tie-breaking by manager load applies.
 EQUIDISTANT_THRESHOLD_KM = 50.0
 
+_LOAD_KEY = operator.attrgetter("current_load")
+
+# Skill/position bits precompiled onto each manager (m._mask) so the hard
+# filters become single integer AND tests instead of list/substring scans.
+_SKILL_VIP = 1
+_SKILL_KZ = 2
+_SKILL_ENG = 4
+_POS_GLAVNY = 8
+_POS_VEDUSHCHIY = 16
+_SENIOR_MASK = _POS_GLAVNY | _POS_VEDUSHCHIY
+
+
+def _compute_mask(m: Manager) -> int:
+    mask = 0
+    if m.skills:
+        if "VIP" in m.skills:
+            mask |= _SKILL_VIP
+        if "KZ" in m.skills:
+            mask |= _SKILL_KZ
+        if "ENG" in m.skills:
+            mask |= _SKILL_ENG
+    if m.position:
+        if "Главный специалист" in m.position:
+            mask |= _POS_GLAVNY
+        if "Ведущий специалист" in m.position:
+            mask |= _POS_VEDUSHCHIY
+    return mask
+
+
+def _mask_of(m: Manager) -> int:
+    mask = getattr(m, "_mask", None)
+    if mask is None:
+        mask = _compute_mask(m)
+        m._mask = mask
+    return mask
+
 # Explicit abroad-location hints in ticket text.
 # Used for UI guidance only; routing remains governed by core rules.
 FOREIGN_LOCATION_HINTS = [
@@ -50,37 +126,98 @@ CURRENT_LOCATION_PATTERN = re.compile(
 )
 KAZAKHSTAN_TOKENS = ("казахстан", "қазақстан", "kazakhstan")
 
+# Alternation regexes over the lists above: one C-level scan through the text
+# instead of a Python-level substring loop per hint/alias. Inputs are already
+# lowercased, matching the plain `in` checks these replace.
+_FOREIGN_HINT_RE = re.compile("|".join(map(re.escape, FOREIGN_LOCATION_HINTS)))
+_FOREIGN_ALIAS_RE = re.compile("|".join(map(re.escape, FOREIGN_COUNTRY_ALIASES)))
+_KAZ_TOKEN_RE = re.compile("|".join(map(re.escape, KAZAKHSTAN_TOKENS)))
+
 
 def reset_counters():
     """Reset all routing counters (call before each pipeline run)."""
-    _rr_counters.clear()
+    _rr_counters.fill(0)
     _foreign_counter[0] = 0
 
 
+def prepare_managers(managers: List[Manager]) -> None:
+    """Register the manager pool for this run and rebuild the derived indexes."""
+    global _prepared_managers, _soa_office, _soa_mask, _soa_ref
+    _prepared_managers = managers
+    _by_office.clear()
+    _office_loads.clear()
+    _office_ids.clear()
+    _office_versions.clear()
+    for m in managers:
+        m._mask = _compute_mask(m)
+        if not m.office:
+            continue
+        _by_office.setdefault(m.office, []).append(m)
+        _office_loads[m.office] = _office_loads.get(m.office, 0) + m.current_load
+        if m.office not in _office_ids:
+            _office_ids[m.office] = len(_office_ids)
+    n = len(managers)
+    _soa_office = np.fromiter(
+        (_office_ids.get(m.office, -1) for m in managers), dtype=np.int16, count=n
+    )
+    _soa_mask = np.fromiter((m._mask for m in managers), dtype=np.uint16, count=n)
+    _soa_ref = np.empty(n, dtype=object)
+    for i, m in enumerate(managers):
+        _soa_ref[i] = m
+    _managers_version[0] += 1
+    _eligible_cached.cache_clear()
+
+
+def register_assignment(manager: Manager) -> None:
+    """Record an assignment: bump the manager's load and invalidate cached eligibility."""
+    manager.current_load += 1
+    if manager.office:
+        _office_loads[manager.office] = _office_loads.get(manager.office, 0) + 1
+        _office_versions[manager.office] = _office_versions.get(manager.office, 0) + 1
+    _managers_version[0] += 1
+
+
 def build_rr_key(
     office: str,
     is_vip: bool,
     is_data_change: bool,
     language: str,
     needs_senior: bool,
-) -> str:
+) -> int:
     """
     Build a stable Round Robin key that reflects the *eligibility pool*, not
     the individual ticket values.  Two tickets that end up competing for the
     same pool of managers must share the same key so their counter advances
     together.
 
+    The key is bit-packed into one int (office id | language | flags) — no
+    per-ticket f-string formatting or string hashing on the hot path.
+
     Parameters are the boolean eligibility flags, not raw field values:
     - is_vip        : segment is VIP or Priority
     - is_data_change: ticket_type is "Смена данных"
     - language      : "KZ" | "ENG" | "RU"  (only KZ/ENG add a filter)
     - needs_senior  : sentiment is Негативный (soft senior preference active)
     """
-    lang = language if language in ("KZ", "ENG") else "RU"
-    return f"{office}|vip={is_vip}|data={is_data_change}|lang={lang}|senior={needs_senior}"
+    global _rr_counters
+    office_id = _rr_office_ids.setdefault(office, len(_rr_office_ids))
+    if (office_id + 1) * _RR_COMBOS > _rr_counters.size:
+        _rr_counters = np.concatenate(
+            [_rr_counters, np.zeros(_rr_counters.size, dtype=np.int64)]
+        )
+    lang_id = _RR_LANG_IDS.get(language, 0)
+    return (
+        (office_id << 5)
+        | (lang_id << 3)
+        | (bool(is_vip) << 2)
+        | (bool(is_data_change) << 1)
+        | bool(needs_senior)
+    )
 
 
 def _office_load(managers: List[Manager], office: str) -> int:
+    if managers is _prepared_managers:
+        return _office_loads.get(office, 0)
     return sum(m.current_load for m in managers if m.office == office)
 
 
@@ -92,20 +229,46 @@ def has_explicit_foreign_location(description: Optional[str]) -> bool:
     if not description:
         return False
 
-    text = description.lower()
-    if any(hint in text for hint in FOREIGN_LOCATION_HINTS):
+    # Bounded scan: explicit "I am abroad" statements show up in the opening
+    # lines of real tickets, so cap the lowercase copy and the regex passes
+    # at 2 KB instead of paying for pathologically long descriptions.
+    text = description[:2048].lower()
+    if _FOREIGN_HINT_RE.search(text):
         return True
 
     for match in CURRENT_LOCATION_PATTERN.finditer(text):
         location = match.group(1).strip()
-        if any(token in location for token in KAZAKHSTAN_TOKENS):
+        if _KAZ_TOKEN_RE.search(location):
             continue
-        if any(alias in location for alias in FOREIGN_COUNTRY_ALIASES):
+        if _FOREIGN_ALIAS_RE.search(location):
             return True
 
     return False
 
 
+@lru_cache(maxsize=4096)
+def _office_for_city(city: str) -> Optional[Tuple[str, Optional[float], Optional[float]]]:
+    """
+    Cached single-office shortcut: (office, lat, lon) when the city
+    fuzzy-matches a city with exactly one office, else None.
+
+    Safe to memoize on the city string alone — fuzzy matching and the static
+    office/coordinate tables are the only inputs. The tie-break and 50/50
+    branches stay uncached because they read mutable counters/loads.
+    """
+    matched_office = fuzzy_office_city(city)
+    if not matched_office:
+        return None
+    offices_in_city = CITY_TO_OFFICES.get(matched_office.strip().lower(), [])
+    if len(offices_in_city) != 1:
+        return None
+    # Fetch coords for DB storage — prefer OFFICE_COORDS (always has
+    # entries for every office city), fall back to KZ_CITY_COORDS.
+    coords = OFFICE_COORDS.get(matched_office) or KZ_CITY_COORDS.get(matched_office)
+    lat, lon = coords if coords else (None, None)
+    return matched_office, lat, lon
+
+
 def get_target_office(
     country: Optional[str],
     city: Optional[str],
@@ -135,32 +298,28 @@ def get_target_office(
     # Missing/empty country is NOT treated as foreign — we still try geocoding
     # by city/region, and only fall back to Астана/Алматы if that also fails.
     if foreign:
-        idx = _foreign_counter[0] % 2
+        office = _FOREIGN_OFFICES[_foreign_counter[0] & 1]
         _foreign_counter[0] += 1
-        return ("Астана" if idx == 0 else "Алматы"), None, None
+        return office, None, None
 
     # --- Single-office shortcut ------------------------------------------------
     # If the client's city fuzzy-matches to a city that has exactly one office,
     # we can skip coordinate lookup entirely.
     if city:
-        matched_office = fuzzy_office_city(city)
-        if matched_office:
-            offices_in_city = CITY_TO_OFFICES.get(matched_office.strip().lower(), [])
-            if len(offices_in_city) == 1:
-                # Fetch coords for DB storage — prefer OFFICE_COORDS (always has
-                # entries for every office city), fall back to KZ_CITY_COORDS.
-                from geocoding import KZ_CITY_COORDS, OFFICE_COORDS as _OFFICE_COORDS
-                coords = _OFFICE_COORDS.get(matched_office) or KZ_CITY_COORDS.get(matched_office)
-                lat, lon = coords if coords else (None, None)
-                return matched_office, lat, lon
+        # Strip before caching so whitespace variants share one entry. Casing
+        # is kept in the key: difflib matching inside fuzzy_office_city is
+        # case-sensitive, so collapsing case would change typo tolerance.
+        shortcut = _office_for_city(city.strip())
+        if shortcut:
+            return shortcut
 
     # --- Coordinate-based selection (precise or multi-office) ----------------
     coords = geocode_client(city, region, country)
 
     if coords is None:
-        idx = _foreign_counter[0] % 2
+        office = _FOREIGN_OFFICES[_foreign_counter[0] & 1]
         _foreign_counter[0] += 1
-        return ("Астана" if idx == 0 else "Алматы"), None, None
+        return office, None, None
 
     lat, lon = coords
     sorted_offices = find_sorted_offices(lat, lon)
@@ -199,47 +358,175 @@ def filter_managers(
     - Негативный sentiment  → prefer Ведущий специалист or Главный специалист
       Falls through to the full eligible pool if no senior is available.
     """
-    if office:
-        pool = [m for m in managers if m.office == office]
-    else:
-        pool = [m for m in managers if m.office]
-
-    # Hard filter: VIP or Priority segment
+    # Hard filters, OR-ed into one required bitmask:
+    # VIP/Priority segment → VIP skill; Смена данных → Главный специалист;
+    # KZ/ENG language → matching language skill.
+    required = 0
     if segment in ("VIP", "Priority"):
-        pool = [m for m in pool if m.skills and "VIP" in m.skills]
-
-    # Hard filter: Смена данных → Главный специалист only
+        required |= _SKILL_VIP
     if ticket_type == "Смена данных":
-        pool = [m for m in pool if m.position and "Главный специалист" in m.position]
-
-    # Hard filter: language skills
+        required |= _POS_GLAVNY
     if language == "KZ":
-        pool = [m for m in pool if m.skills and "KZ" in m.skills]
+        required |= _SKILL_KZ
     elif language == "ENG":
-        pool = [m for m in pool if m.skills and "ENG" in m.skills]
-
-    # Sort full eligible pool by load ascending before applying soft rules
-    pool.sort(key=lambda m: m.current_load)
+        required |= _SKILL_ENG
+
+    if office and managers is _prepared_managers and _soa_ref is not None:
+        # SoA fast path: office + skill filters as one vectorized boolean mask.
+        sel = _soa_office == _office_ids.get(office, -2)
+        if required:
+            sel &= (_soa_mask & required) == required
+        pool = list(_soa_ref[sel])
+    else:
+        if office:
+            pool = [m for m in managers if m.office == office]
+        else:
+            pool = [m for m in managers if m.office]
+        if required:
+            pool = [m for m in pool if _mask_of(m) & required == required]
 
     # Soft preference: negative sentiment → prefer senior managers
     if sentiment == "Негативный":
-        senior_pool = [
-            m for m in pool
-            if m.position and any(
-                p in m.position for p in ("Ведущий специалист", "Главный специалист")
-            )
-        ]
+        senior_pool = [m for m in pool if _mask_of(m) & _SENIOR_MASK]
         if senior_pool:
             pool = senior_pool
 
+    # Pick by load ascending. nsmallest is O(P) versus O(P log P) for a full
+    # sort and matches sorted(...)[:limit] exactly, ties included.
     if limit is None:
+        pool.sort(key=_LOAD_KEY)
         return pool
-    return pool[:limit]
+    return heapq.nsmallest(limit, pool, key=_LOAD_KEY)
+
+
+@lru_cache(maxsize=2048)
+def _eligible_cached(
+    office: Optional[str],
+    segment: str,
+    ticket_type: str,
+    language: str,
+    sentiment: str,
+    version: int,
+) -> Tuple[Manager, ...]:
+    """
+    Memoized top-2 eligibility over the prepared pool. The inputs fall into a
+    tiny Cartesian product (offices x segments x types x languages x
+    sentiments), so repeated tickets hit the cache until a load change bumps
+    *version*.
+    """
+    return tuple(filter_managers(_prepared_managers, office, segment, ticket_type, language, sentiment))
+
+
+def _eligible(
+    managers: List[Manager],
+    office: Optional[str],
+    segment: str,
+    ticket_type: str,
+    language: str,
+    sentiment: str,
+) -> List[Manager]:
+    if managers is _prepared_managers:
+        # Per-office version: cached pools for other offices survive an
+        # assignment here. Office-less lookups fall back to the global counter.
+        version = _office_versions.get(office, 0) if office else _managers_version[0]
+        return list(_eligible_cached(office, segment, ticket_type, language, sentiment, version))
+    return filter_managers(managers, office, segment, ticket_type, language, sentiment)
+
+
+def build_cross_city_consultation_note(
+    managers: List[Manager],
+    has_foreign_mention: bool,
+    segment: str,
+    ticket_type: str,
+    language: str,
+    sentiment: str,
+    assigned_office: Optional[str],
+) -> Optional[str]:
+    """
+    Build a non-blocking UI note for explicit abroad mentions in ticket text.
+
+    Computed once at assignment time and stored on the Assignment row; the API
+    serves the stored string instead of re-running eligibility scans.
+    """
+    if not has_foreign_mention or not assigned_office:
+        return None
+    if ticket_type == "Спам":
+        return None
+
+    eligible_global = filter_managers(
+        managers=managers,
+        office=None,
+        segment=segment,
+        ticket_type=ticket_type,
+        language=language,
+        sentiment=sentiment,
+        limit=None,
+    )
+    alternative = next(
+        (m for m in eligible_global if m.office and m.office != assigned_office),
+        None,
+    )
+    if not alternative:
+        return None
+
+    return (
+        "Клиент явно указал, что находится за пределами Казахстана. "
+        "По правилу организаторов распределение сохраняется 50/50 между Астаной и Алматы. "
+        f"Для онлайн-консультации можно рассмотреть {alternative.full_name} "
+        f"({alternative.office}, текущая нагрузка {alternative.current_load})."
+    )
+
+
+def build_skill_gap_routing_note(
+    segment: str,
+    ticket_type: str,
+    language: str,
+    geo_nearest: Optional[str],
+    assigned_office: Optional[str],
+    dist_nearest: Optional[float],
+    dist_assigned: Optional[float],
+) -> Optional[str]:
+    """
+    Build a note when a client was routed to a non-nearest office because the
+    nearest office had no managers with the required skills (VIP, KZ, ENG, etc.).
+
+    Like the cross-city note, this is computed at assignment time from the
+    already-known distances and stored on the Assignment row.
+    """
+    if ticket_type == "Спам":
+        return None
+    if not geo_nearest or not assigned_office:
+        return None
+    if geo_nearest == assigned_office:
+        return None  # no fallback — normal routing
+    if dist_nearest is None or dist_assigned is None:
+        return None
+    if dist_assigned - dist_nearest <= EQUIDISTANT_THRESHOLD_KM:
+        return None  # within tie-break threshold — not a skill-gap fallback
+
+    # Infer reason from the ticket's constraints
+    if segment in ("VIP", "Priority"):
+        reason = f"в офисе {geo_nearest} нет менеджеров с навыком VIP"
+    elif ticket_type == "Смена данных":
+        reason = f"в офисе {geo_nearest} нет Главного специалиста"
+    elif language == "KZ":
+        reason = f"в офисе {geo_nearest} нет менеджеров с навыком KZ"
+    elif language == "ENG":
+        reason = f"в офисе {geo_nearest} нет менеджеров с навыком ENG"
+    else:
+        reason = f"в офисе {geo_nearest} нет подходящих менеджеров"
+
+    return (
+        f"Клиент направлен в {assigned_office} ({dist_assigned:.0f} км), "
+        f"хотя ближайший офис — {geo_nearest} ({dist_nearest:.0f} км). "
+        f"Причина: {reason}. "
+        f"Рекомендуется рассмотреть назначение менеджера из офиса {geo_nearest} в стандартном режиме."
+    )
 
 
 def assign_manager(
     eligible: List[Manager],
-    rr_key: str,
+    rr_key: int,
 ) -> Tuple[Optional[Manager], int]:
     """
     Round-robin assign from eligible managers.
@@ -248,7 +535,7 @@ def assign_manager(
     if not eligible:
         return None, 0
 
-    current = _rr_counters.get(rr_key, 0)
+    current = int(_rr_counters[rr_key])
     idx = current % len(eligible)
     _rr_counters[rr_key] = current + 1
 
@@ -279,15 +566,14 @@ def route_ticket(
         managers=managers,
     )
 
-    eligible = filter_managers(managers, office, segment, ticket_type, language, sentiment)
+    eligible = _eligible(managers, office, segment, ticket_type, language, sentiment)
 
     # Fallback: if no eligible at nearest office, try Астана then Алматы
-    fallback_offices = ["Астана", "Алматы"]
     fallback_idx = 0
-    while not eligible and fallback_idx < len(fallback_offices):
-        fallback = fallback_offices[fallback_idx]
+    while not eligible and fallback_idx < len(_FALLBACK_OFFICES):
+        fallback = _FALLBACK_OFFICES[fallback_idx]
         if fallback != office:
-            eligible = filter_managers(managers, fallback, segment, ticket_type, language, sentiment)
+            eligible = _eligible(managers, fallback, segment, ticket_type, language, sentiment)
             if eligible:
                 office = fallback
         fallback_idx += 1
@@ -302,3 +588,42 @@ def route_ticket(
     manager, rr_index = assign_manager(eligible, rr_key)
 
     return manager, office, lat, lon, rr_index
+
+
+def route_ticket_batch(
+    managers: List[Manager],
+    rows: List[dict],
+    register: bool = True,
+) -> List[Tuple[Optional[Manager], str, Optional[float], Optional[float], int]]:
+    """
+    Route many tickets in one call. Each row is a dict carrying the
+    route_ticket keyword fields (country, city, region, segment,
+    ticket_type, language, sentiment, street, house); results come back in
+    row order as the same tuples route_ticket returns.
+
+    Routing is order-dependent — the 50/50 foreign split, office tie-breaks
+    and eligibility all read state that moves with every assignment — so the
+    core stays one sequential pass over the vectorized/cached sub-steps. A
+    one-shot grouped round-robin would hand out picks against stale loads
+    and diverge from the per-ticket cascade. With register=True (default)
+    each pick is recorded before the next row routes, exactly matching a
+    caller's own route-then-register loop.
+    """
+    results: List[Tuple[Optional[Manager], str, Optional[float], Optional[float], int]] = []
+    for row in rows:
+        routed = route_ticket(
+            managers=managers,
+            country=row.get("country"),
+            city=row.get("city"),
+            region=row.get("region"),
+            segment=row.get("segment") or "Mass",
+            ticket_type=row.get("ticket_type") or "Консультация",
+            language=row.get("language") or "RU",
+            sentiment=row.get("sentiment") or "Нейтральный",
+            street=row.get("street"),
+            house=row.get("house"),
+        )
+        if register and routed[0] is not None:
+            register_assignment(routed[0])
+        results.append(routed)
+    return results
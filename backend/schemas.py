@@ -1,100 +1,95 @@
-from pydantic import BaseModel
-from typing import Optional, List
-from datetime import date, datetime
-
-
-class BusinessUnitOut(BaseModel):
-    id: int
-    office_name: str
-    address: Optional[str]
-    latitude: Optional[float]
-    longitude: Optional[float]
-
-    class Config:
-        from_attributes = True
-
-
-class ManagerOut(BaseModel):
-    id: int
-    full_name: str
-    position: Optional[str]
-    office: Optional[str]
-    skills: Optional[List[str]]
-    current_load: int
-
-    class Config:
-        from_attributes = True
-
-
-class TicketAnalysisOut(BaseModel):
-    ticket_type: Optional[str]
-    sentiment: Optional[str]
-    priority_score: Optional[int]
-    language: Optional[str]
-    summary: Optional[str]
-    recommendation: Optional[str]
-    attachment_description: Optional[str]
-    client_lat: Optional[float]
-    client_lon: Optional[float]
-    nearest_office: Optional[str]
-    geo_nearest_office: Optional[str]
-    dist_to_nearest_km: Optional[float]
-    dist_to_assigned_km: Optional[float]
-    analyzed_at: Optional[datetime]
-
-    class Config:
-        from_attributes = True
-
-
-class AssignmentOut(BaseModel):
-    assigned_office: Optional[str]
-    round_robin_index: Optional[int]
-    assigned_at: Optional[datetime]
-    manager: Optional[ManagerOut]
-
-    class Config:
-        from_attributes = True
-
-
-class TicketOut(BaseModel):
-    id: int
-    guid: str
-    gender: Optional[str]
-    birth_date: Optional[date]
-    description: Optional[str]
-    attachment: Optional[str]
-    segment: Optional[str]
-    country: Optional[str]
-    region: Optional[str]
-    city: Optional[str]
-    street: Optional[str]
-    house: Optional[str]
-    analysis: Optional[TicketAnalysisOut]
-    assignment: Optional[AssignmentOut]
-    cross_city_consultation_note: Optional[str] = None
-    skill_gap_routing_note: Optional[str] = None
-
-    class Config:
-        from_attributes = True
-
-
-class StatsOut(BaseModel):
-    total_tickets: int
-    by_type: dict
-    by_sentiment: dict
-    by_segment: dict
-    by_language: dict
-    by_office: dict
-    avg_priority: float
-    manager_loads: List[dict]
-
-
-class AssistantRequest(BaseModel):
-    query: str
-
-
-class AssistantResponse(BaseModel):
-    answer: str
-    chart_type: Optional[str]
-    chart_data: Optional[dict]
-    sql: Optional[str]
+from pydantic import BaseModel, ConfigDict
+from typing import Optional
+from datetime import date, datetime
+
+
+class BusinessUnitOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    office_name: str
+    address: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
+class ManagerOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    full_name: str
+    position: Optional[str]
+    office: Optional[str]
+    skills: Optional[list[str]]
+    current_load: int
+
+
+class TicketAnalysisOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    ticket_type: Optional[str]
+    sentiment: Optional[str]
+    priority_score: Optional[int]
+    language: Optional[str]
+    summary: Optional[str]
+    recommendation: Optional[str]
+    attachment_description: Optional[str]
+    client_lat: Optional[float]
+    client_lon: Optional[float]
+    nearest_office: Optional[str]
+    geo_nearest_office: Optional[str]
+    dist_to_nearest_km: Optional[float]
+    dist_to_assigned_km: Optional[float]
+    analyzed_at: Optional[datetime]
+
+
+class AssignmentOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    assigned_office: Optional[str]
+    round_robin_index: Optional[int]
+    assigned_at: Optional[datetime]
+    manager: Optional[ManagerOut]
+
+
+class TicketOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    guid: str
+    gender: Optional[str]
+    birth_date: Optional[date]
+    description: Optional[str]
+    attachment: Optional[str]
+    segment: Optional[str]
+    country: Optional[str]
+    region: Optional[str]
+    city: Optional[str]
+    street: Optional[str]
+    house: Optional[str]
+    analysis: Optional[TicketAnalysisOut]
+    assignment: Optional[AssignmentOut]
+    cross_city_consultation_note: Optional[str] = None
+    skill_gap_routing_note: Optional[str] = None
+
+
+class StatsOut(BaseModel):
+    total_tickets: int
+    by_type: dict[str, int]
+    by_sentiment: dict[str, int]
+    by_segment: dict[str, int]
+    by_language: dict[str, int]
+    by_office: dict[str, int]
+    avg_priority: float
+    manager_loads: list[dict]
+
+
+class AssistantRequest(BaseModel):
+    query: str
+
+
+class AssistantResponse(BaseModel):
+    answer: str
+    chart_type: Optional[str]
+    chart_data: Optional[dict]
+    sql: Optional[str]